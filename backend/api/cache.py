@@ -0,0 +1,161 @@
+"""Кэш ответов ленты рецептов для анонимных пользователей.
+
+Ключ ответа строится из нормализованных параметров запроса и версий
+областей (scope), от которых он зависит: всей ленты, автора, тега или
+отдельного рецепта. При изменении данных сигналы меняют версии только
+затронутых областей, поэтому старые ответы перестают находиться в кэше
+без полной очистки.
+"""
+import hashlib
+import json
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+from rest_framework.response import Response
+
+from recipes.models import Recipe, Tag
+
+LIST_PARAMS = ('author', 'page', 'limit', 'cursor', 'search')
+
+FEED_SCOPE = 'feed'
+
+_pending = threading.local()
+
+
+def get_cache():
+    return caches[settings.RECIPE_CACHE_ALIAS]
+
+
+def _version_key(scope):
+    return f'recipes:version:{scope}'
+
+
+def get_versions(scopes):
+    """Текущие версии областей; отсутствующие создаются заново."""
+    cache = get_cache()
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(scopes):
+    get_cache().set_many(
+        {_version_key(scope): uuid.uuid4().hex for scope in scopes}, None
+    )
+
+
+def _make_key(kind, request, params, scopes):
+    payload = json.dumps(
+        [request.build_absolute_uri('/'), params, get_versions(scopes)],
+        sort_keys=True,
+    )
+    digest = hashlib.md5(payload.encode()).hexdigest()
+    return f'recipes:{kind}:{digest}'
+
+
+def list_cache_key(request):
+    query = request.query_params
+    params = {name: query.get(name) for name in LIST_PARAMS}
+    params['tags'] = sorted(set(query.getlist('tags')))
+    scopes = [f'tag:{slug}' for slug in params['tags']]
+    if params['author'] is not None:
+        try:
+            params['author'] = int(params['author'])
+        except ValueError:
+            pass
+        scopes.append(f'author:{params["author"]}')
+    return _make_key('list', request, params, scopes or [FEED_SCOPE])
+
+
+def detail_cache_key(request, pk):
+    return _make_key('detail', request, {'pk': pk}, [f'recipe:{pk}'])
+
+
+class AnonymousCacheMixin:
+    """Кэширует list и retrieve для анонимных GET-запросов."""
+
+    def _cached(self, key, handler, *args, **kwargs):
+        cache = get_cache()
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(*args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RECIPE_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        return self._cached(
+            list_cache_key(request), super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        return self._cached(
+            detail_cache_key(request, kwargs[self.lookup_field]),
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+def _get_pending():
+    if not hasattr(_pending, 'recipes'):
+        _pending.recipes = set()
+        _pending.authors = set()
+        _pending.scopes = set()
+    return _pending
+
+
+def recipe_scopes(recipe_ids=(), author_ids=()):
+    """Области, в которые попадают указанные рецепты и авторы."""
+    recipes = Recipe.objects.filter(
+        Q(id__in=recipe_ids) | Q(author_id__in=author_ids)
+    ).values_list('id', 'author_id')
+    recipe_ids = set(recipe_ids)
+    author_ids = set(author_ids)
+    for recipe_id, author_id in recipes:
+        recipe_ids.add(recipe_id)
+        author_ids.add(author_id)
+    slugs = Tag.objects.filter(
+        recipes__in=recipe_ids
+    ).values_list('slug', flat=True).distinct()
+    return {
+        FEED_SCOPE,
+        *(f'recipe:{recipe_id}' for recipe_id in recipe_ids),
+        *(f'author:{author_id}' for author_id in author_ids),
+        *(f'tag:{slug}' for slug in slugs),
+    }
+
+
+def _flush():
+    pending = _get_pending()
+    if not (pending.recipes or pending.authors or pending.scopes):
+        return
+    scopes = pending.scopes | recipe_scopes(pending.recipes, pending.authors)
+    pending.recipes.clear()
+    pending.authors.clear()
+    pending.scopes.clear()
+    bump_versions(scopes)
+
+
+def invalidate(recipe_ids=(), author_ids=(), scopes=()):
+    """Сбрасывает кэш затронутых областей после фиксации транзакции.
+
+    Изменения копятся до коммита, так что правка рецепта с десятком
+    ингредиентов сбрасывает версии одним обращением к кэшу.
+    """
+    pending = _get_pending()
+    pending.recipes.update(recipe_ids)
+    pending.authors.update(author_ids)
+    pending.scopes.update(scopes)
+    transaction.on_commit(_flush)
@@ -0,0 +1,67 @@
+"""Условные GET-запросы: ETag и Last-Modified без сериализации ответа.
+
+Представление возвращает валидаторы из дешёвых источников — версий
+данных в базе (recipes.versions) и дат изменения рецептов. Если клиент
+прислал совпадающие If-None-Match или If-Modified-Since, ответ 304
+отдаётся до выборки данных и работы сериализаторов.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from recipes import versions
+
+NANOSECONDS = 10 ** 9
+
+
+def make_etag(request, *parts):
+    """Слабый ETag для представления ресурса по адресу запроса."""
+    payload = repr((
+        request.build_absolute_uri(),
+        request.accepted_renderer.format,
+        *parts,
+    ))
+    return f'W/"{hashlib.md5(payload.encode()).hexdigest()}"'
+
+
+def version_timestamp(version):
+    """Версия из recipes.versions в секундах для Last-Modified."""
+    return version // NANOSECONDS
+
+
+class ConditionalGetMixin:
+    """Отвечает 304 на list и retrieve, если данные не менялись.
+
+    По умолчанию валидаторы строятся из версий version_names.
+    """
+    version_names = ()
+
+    def get_validators(self, request, *args, **kwargs):
+        """Пара (etag, last_modified в секундах); None — не проверять."""
+        current = versions.get_versions(*self.version_names)
+        return make_etag(request, *current), version_timestamp(max(current))
+
+    def _conditional(self, handler, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, *args, **kwargs)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        if etag is not None:
+            response.headers['ETag'] = etag
+        if last_modified is not None:
+            response.headers['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(
+            super().retrieve, request, *args, **kwargs
+        )
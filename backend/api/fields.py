@@ -3,6 +3,8 @@ import base64
 from django.core.files.base import ContentFile
 from rest_framework import serializers
 
+from recipes.images import FORMATS, SIZES, derivative_urls
+
 
 class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
@@ -13,3 +15,44 @@ class Base64ImageField(serializers.ImageField):
             data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
 
         return super().to_internal_value(data)
+
+
+def image_derivatives(name, absolute_url=None):
+    """Адреса уменьшенных копий и srcset для каждого формата."""
+    urls = derivative_urls(name)
+    if absolute_url is not None:
+        urls = {
+            size: {
+                extension: absolute_url(url)
+                for extension, url in formats.items()
+            }
+            for size, formats in urls.items()
+        }
+    srcset = {
+        extension: ', '.join(
+            f'{urls[size][extension]} {width}w'
+            for size, (width, _) in SIZES.items()
+        )
+        for extension in FORMATS
+    }
+    return {**urls, 'srcset': srcset}
+
+
+class ImageDerivativesField(serializers.ReadOnlyField):
+    """Адреса уменьшенных копий изображения рецепта и srcset.
+
+    None, пока фоновая задача не построила копии (images_ready).
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image or not recipe.images_ready:
+            return None
+        request = self.context.get('request')
+        return image_derivatives(
+            recipe.image.name,
+            request.build_absolute_uri if request is not None else None,
+        )
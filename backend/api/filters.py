@@ -1,21 +1,24 @@
 from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
-from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe, Tag, ShoppingCart
-
-
-class IngredientSearchFilter(SearchFilter):
-    search_param = "name"
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+from recipes.search import search
 
 
 class RecipeFilter(filters.FilterSet):
+    """Фильтры ленты.
+
+    Связи проверяются подзапросами EXISTS, а не соединениями: строки
+    рецептов не размножаются, DISTINCT не нужен, и лента сохраняет
+    порядок индекса (-pub_date, -id) при любом сочетании фильтров.
+    """
     tags = filters.ModelMultipleChoiceFilter(
-        field_name="tags__slug",
         to_field_name="slug",
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        method="filter_tags",
     )
-    author = filters.NumberFilter(field_name="author__id")
+    author = filters.NumberFilter(field_name="author")
+    search = filters.CharFilter(method="filter_search")
     is_favorited = filters.BooleanFilter(method="filter_is_favorited")
     is_in_shopping_cart = filters.BooleanFilter(method="filter_is_in_cart")
 
@@ -24,6 +27,7 @@ class RecipeFilter(filters.FilterSet):
         fields = (
             "tags",
             "author",
+            "search",
             "is_favorited",
             "is_in_shopping_cart",
         )
@@ -31,23 +35,27 @@ class RecipeFilter(filters.FilterSet):
     def _boolean_param(self, value):
         return value in (True, "1", 1, "true", "True", "") or value is None
 
-    def filter_is_favorited(self, qs, name, value):
+    def _filter_user_recipes(self, qs, model, value):
         user = self.request.user
-        if not user.is_authenticated:
+        if not user.is_authenticated or not self._boolean_param(value):
             return qs
-        return (
-            qs.filter(in_favorites__user=user)
-            if self._boolean_param(value)
-            else qs
-        )
+        return qs.filter(Exists(
+            model.objects.filter(user=user, recipe=OuterRef("pk"))
+        ))
 
-    def filter_is_in_cart(self, qs, name, value):
-        user = self.request.user
-        if not user.is_authenticated:
+    def filter_tags(self, qs, name, value):
+        if not value:
             return qs
-        if not self._boolean_param(value):
-            return qs
-        sub_qs = ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
-        return qs.annotate(
-            in_cart=Exists(sub_qs)).filter(in_cart=True
-                                           ).order_by("id").distinct("id")
+        return qs.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef("pk"),
+            tag__in=[tag.pk for tag in value],
+        )))
+
+    def filter_search(self, qs, name, value):
+        return search(qs, value)
+
+    def filter_is_favorited(self, qs, name, value):
+        return self._filter_user_recipes(qs, Favorite, value)
+
+    def filter_is_in_cart(self, qs, name, value):
+        return self._filter_user_recipes(qs, ShoppingCart, value)
@@ -0,0 +1,157 @@
+"""Замер быстрого представления списков.
+
+Для каждой страницы команда строит ответ дважды: прежними
+сериализаторами (RecipeReadSerializer, IngredientSerializer,
+SubscribedAuthorSerializer) и функциями api.representations, и печатает
+время построения страницы вместе с запросами к базе и ускорение.
+Совпадение ответов байт в байт проверяет ValuesListContractTest.
+"""
+import statistics
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from api.representations import (
+    USER_VALUES,
+    author_recipes,
+    subscription_list,
+)
+from api.serializers import (
+    IngredientSerializer,
+    RecipeReadSerializer,
+    SubscribedAuthorSerializer,
+)
+from api.utils import command_request_factory
+from api.views import IngredientViewSet, RecipeViewSet, UserViewSet
+from recipes.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает скорость быстрых списков рецептов, ингредиентов и '
+        'подписок со скоростью сериализаторов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=100,
+            help='Размер страницы рецептов и подписок.'
+        )
+        parser.add_argument(
+            '--recipes-limit', type=int, default=3,
+            help='Рецептов у каждого автора в подписках.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз построить каждую страницу.'
+        )
+        parser.add_argument(
+            '--user', type=int,
+            help='Id пользователя (по умолчанию — с наибольшим числом '
+                 'подписок).'
+        )
+
+    def _view(self, viewset, user, params):
+        view = viewset(
+            action_map={'get': 'list'}, format_kwarg=None, args=(),
+            kwargs={},
+        )
+        request = view.initialize_request(
+            command_request_factory().get('/', params)
+        )
+        request.user = user
+        view.request = request
+        return view
+
+    def _recipes(self, user):
+        def reference():
+            view = self._view(RecipeViewSet, user, {})
+            recipes = view.filter_queryset(view.get_queryset())
+            return RecipeReadSerializer(
+                recipes[:self.limit], many=True,
+                context={'request': view.request},
+            ).data
+
+        def fast():
+            view = self._view(RecipeViewSet, user, {})
+            rows = view.get_list_rows(
+                view.filter_queryset(view.get_queryset())
+            )
+            return view.represent_list(list(rows[:self.limit]))
+
+        return reference, fast
+
+    def _ingredients(self, user):
+        def reference():
+            view = self._view(IngredientViewSet, user, {})
+            return IngredientSerializer(
+                view.filter_queryset(view.get_queryset()), many=True
+            ).data
+
+        def fast():
+            view = self._view(IngredientViewSet, user, {})
+            return view.represent_list(
+                view.get_list_rows(view.filter_queryset(view.get_queryset()))
+            )
+
+        return reference, fast
+
+    def _subscriptions(self, user):
+        params = {'recipes_limit': self.recipes_limit}
+
+        def reference():
+            view = self._view(UserViewSet, user, params)
+            authors = view.get_authors_with_recipes().filter(
+                authors__user=user
+            )
+            return SubscribedAuthorSerializer(
+                authors[:self.limit], many=True,
+                context={'request': view.request},
+            ).data
+
+        def fast():
+            view = self._view(UserViewSet, user, params)
+            authors = list(User.objects.filter(authors__user=user).values(
+                *USER_VALUES, 'recipes_count'
+            )[:self.limit])
+            recipes = author_recipes(
+                [author['id'] for author in authors],
+                view.get_recipes_limit(),
+            )
+            return subscription_list(authors, recipes, view.request)
+
+        return reference, fast
+
+    def _timing(self, build):
+        timings = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            JSONRenderer().render(build())
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def handle(self, *args, limit=100, recipes_limit=3, repeat=20,
+               user=None, **options):
+        users = User.objects.order_by('-subscriptions_count', 'pk')
+        if user is not None:
+            users = users.filter(pk=user)
+        user = users.first()
+        if user is None:
+            raise CommandError('Нет пользователя: заполните базу.')
+        self.limit = limit
+        self.recipes_limit = recipes_limit
+        self.repeat = repeat
+        for name, make, page_user in (
+            ('Лента, аноним', self._recipes, AnonymousUser()),
+            ('Лента', self._recipes, user),
+            ('Ингредиенты', self._ingredients, AnonymousUser()),
+            ('Подписки', self._subscriptions, user),
+        ):
+            reference_ms, fast_ms = map(self._timing, make(page_user))
+            self.stdout.write(
+                f'{name}: сериализаторы {reference_ms:.1f} мс, '
+                f'быстрый путь {fast_ms:.1f} мс, '
+                f'ускорение {reference_ms / fast_ms:.1f}x'
+            )
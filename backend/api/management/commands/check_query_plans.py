@@ -0,0 +1,204 @@
+"""Проверка планов горячих запросов API на заполненной базе.
+
+Команда выполняет канонические запросы эндпоинтов — ленту с фильтрами,
+рецепт, список покупок и подписки — от имени пользователя, перехватывает
+их SQL и получает для каждого EXPLAIN. Если план читает большую таблицу
+целиком или сортирует не меньше --min-rows строк, команда завершается с
+ошибкой. Изменения данных откатываются.
+"""
+import json
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from rest_framework.test import force_authenticate
+
+from api.pagination import RecipeCursorPagination
+from api.utils import command_request_factory
+from recipes.models import Recipe, Tag, User
+
+# Псевдонимы таблиц в SQL Django: "recipes_favorite" U0.
+ALIAS_RE = re.compile(r'"(\w+)" ([A-Z]\d+)\b')
+SQLITE_SCAN_RE = re.compile(r'^SCAN (\w+)( USING)?')
+SQLITE_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+LIMIT_RE = re.compile(r'\bLIMIT \d+( OFFSET \d+)?$')
+
+
+class Command(BaseCommand):
+    help = (
+        'Получает EXPLAIN горячих запросов API и завершается с ошибкой, '
+        'если план просматривает большую таблицу целиком или сортирует '
+        'её всю.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='Id пользователя, от имени которого выполняются запросы '
+                 '(по умолчанию — с наибольшим числом подписок).'
+        )
+        parser.add_argument(
+            '--min-rows', type=int, default=10000,
+            help='С какого числа строк таблица считается большой, а '
+                 'сортировка — сортировкой всей таблицы.'
+        )
+
+    def _get_requests(self):
+        """Канонические запросы: (название, путь, параметры)."""
+        recipes = reverse('recipes-list')
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        author = User.objects.order_by('-recipes_count').values_list(
+            'pk', flat=True
+        ).first()
+        recipe = Recipe.objects.values_list('pk', flat=True).first()
+        # Ленту проверяем в курсорном режиме: постраничный считает
+        # COUNT(*) всей выборки для поля count и масштабируется хуже.
+        feed = {RecipeCursorPagination.cursor_query_param: ''}
+        requests = [
+            ('Лента', recipes, feed),
+            ('Лента по тегам', recipes, {**feed, 'tags': tags}),
+            ('Лента автора', recipes, {**feed, 'author': author}),
+            ('Избранное', recipes, {**feed, 'is_favorited': 1}),
+            ('Корзина', recipes, {**feed, 'is_in_shopping_cart': 1}),
+            ('Список покупок', reverse('recipes-download-shopping-cart'), {}),
+            ('Подписки', reverse('users-subscriptions'),
+             {'recipes_limit': 3}),
+        ]
+        if recipe is not None:
+            requests.append(
+                ('Рецепт', reverse('recipes-detail', args=(recipe,)), {})
+            )
+        return requests
+
+    def _capture(self, user, path, params):
+        """SQL всех SELECT, выполненных эндпоинтом."""
+        request = command_request_factory().get(path, params)
+        force_authenticate(request, user=user)
+        match = resolve(path)
+        with CaptureQueriesContext(connection) as context:
+            response = match.func(request, *match.args, **match.kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        if response.status_code != 200:
+            raise CommandError(
+                f'{path} ответил {response.status_code}: {response.data}'
+            )
+        return [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].lstrip().upper().startswith('SELECT')
+        ]
+
+    def _is_large(self, table):
+        if table not in self._sizes:
+            size = 0
+            if table in self._tables:
+                with connection.cursor() as cursor:
+                    table_name = connection.ops.quote_name(table)
+                    cursor.execute(f'SELECT count(*) FROM {table_name}')
+                    size = cursor.fetchone()[0]
+            self._sizes[table] = size
+        return self._sizes[table] >= self._min_rows
+
+    def _explain_postgresql(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+            plan = cursor.fetchone()[0]
+            cursor.execute(f'EXPLAIN {sql}')
+            text = '\n'.join(row[0] for row in cursor.fetchall())
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        problems = []
+        # Обход индекса без условия читает его целиком, если выше нет Limit.
+        nodes = [(plan[0]['Plan'], False)]
+        while nodes:
+            node, limited = nodes.pop()
+            limited = limited or node['Node Type'] == 'Limit'
+            nodes.extend((child, limited) for child in node.get('Plans', ()))
+            scan = node['Node Type'] == 'Seq Scan' or (
+                node['Node Type'] in ('Index Scan', 'Index Only Scan')
+                and 'Index Cond' not in node and not limited
+            )
+            if scan and self._is_large(node['Relation Name']):
+                problems.append(
+                    f'полный просмотр таблицы {node["Relation Name"]}'
+                )
+            elif (
+                node['Node Type'] == 'Sort'
+                and node['Plan Rows'] >= self._min_rows
+            ):
+                problems.append(f'сортировка ~{node["Plan Rows"]} строк')
+        return text, problems
+
+    def _explain_sqlite(self, sql):
+        aliases = {alias: table for table, alias in ALIAS_RE.findall(sql)}
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            details = [row[3] for row in cursor.fetchall()]
+        limited = LIMIT_RE.search(sql) is not None
+        problems, scanned = [], []
+        for detail in details:
+            match = SQLITE_SCAN_RE.match(detail)
+            if not match:
+                continue
+            table = aliases.get(match[1], match[1])
+            if not self._is_large(table):
+                continue
+            scanned.append(table)
+            if not (match[2] and limited):
+                problems.append(f'полный просмотр таблицы {table}')
+        # SQLite не оценивает число строк: сортировка считается полной,
+        # если в том же запросе большая таблица читается целиком.
+        if scanned and SQLITE_SORT in details:
+            problems.append(f'сортировка всей таблицы {scanned[0]}')
+        return '\n'.join(details), problems
+
+    def _check(self, name, user, path, params, verbosity):
+        try:
+            with transaction.atomic():
+                queries = self._capture(user, path, params)
+        except DatabaseError as error:
+            self.stdout.write(self.style.ERROR(
+                f'{name}: запрос не выполнен: {error}'
+            ))
+            return False
+        explain = getattr(self, f'_explain_{connection.vendor}')
+        ok = True
+        for sql in dict.fromkeys(queries):
+            plan, problems = explain(sql)
+            if verbosity > 1 or problems:
+                self.stdout.write(f'{name}: {sql}\n{plan}\n')
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(f'{name}: {problem}'))
+            ok = ok and not problems
+        if ok:
+            self.stdout.write(f'{name}: запросов {len(queries)}, в порядке')
+        return ok
+
+    def handle(self, *args, user=None, min_rows=10000, verbosity=1,
+               **options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError(
+                f'Планы {connection.vendor} команда не разбирает.'
+            )
+        users = User.objects.order_by('-subscriptions_count', 'pk')
+        if user is not None:
+            users = users.filter(pk=user)
+        user = users.first()
+        if user is None:
+            raise CommandError('Нет пользователя: заполните базу.')
+        self._min_rows = min_rows
+        self._sizes = {}
+        self._tables = set(connection.introspection.table_names())
+        with transaction.atomic():
+            failed = [
+                name for name, path, params in self._get_requests()
+                if not self._check(name, user, path, params, verbosity)
+            ]
+            transaction.set_rollback(True)
+        if failed:
+            raise CommandError(
+                f'Регрессии планов запросов: {", ".join(failed)}.'
+            )
+        self.stdout.write(self.style.SUCCESS('Планы запросов в порядке.'))
@@ -0,0 +1,245 @@
+"""Метрики обработки запросов.
+
+MetricsMiddleware считает для каждого запроса число и время SQL-запросов
+(через execute_wrapper соединений), время сериализаторов и общее время,
+отдаёт их в заголовке Server-Timing и копит гистограммы по представлениям
+роутера (recipes-list, users-subscriptions и т. д.). Гистограммы
+выдаются в формате Prometheus по /api/_metrics — по токену
+METRICS_TOKEN или сотрудникам. Они хранятся в памяти процесса: при
+нескольких воркерах каждый считает свои запросы.
+
+Запросы, превысившие SLOW_REQUEST_MS или SLOW_REQUEST_QUERIES, пишутся
+в журнал api.metrics.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+UNRESOLVED = '<unresolved>'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_local = threading.local()
+
+
+class RequestMetrics:
+    """Счётчики одного запроса."""
+    __slots__ = ('queries', 'db_time', 'serialize_time', '_serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self._serializing = False
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+
+@contextmanager
+def serializing():
+    """Учитывает время блока как сериализацию в метриках запроса.
+
+    Вложенные блоки не считаются повторно: время идёт только внешнему.
+    """
+    current = getattr(_local, 'metrics', None)
+    if current is None or current._serializing:
+        yield
+        return
+    current._serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.serialize_time += time.perf_counter() - started
+        current._serializing = False
+
+
+class TimedSerializerMixin:
+    """Учитывает время to_representation в метриках текущего запроса."""
+
+    def to_representation(self, instance):
+        with serializing():
+            return super().to_representation(instance)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class EndpointStats:
+    __slots__ = ('duration', 'queries', 'db_time', 'serialize_time')
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+
+
+class Registry:
+    """Гистограммы по паре (представление, метод)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def observe(self, view, method, duration, metrics):
+        with self._lock:
+            stats = self._stats.get((view, method))
+            if stats is None:
+                stats = self._stats[view, method] = EndpointStats()
+            stats.duration.observe(duration)
+            stats.queries.observe(metrics.queries)
+            stats.db_time += metrics.db_time
+            stats.serialize_time += metrics.serialize_time
+
+    def _histogram_lines(self, name, labels, histogram):
+        total = 0
+        for bound, count in zip(
+            (*histogram.buckets, '+Inf'), histogram.counts
+        ):
+            total += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {total}'
+        yield f'{name}_sum{{{labels}}} {histogram.sum}'
+        yield f'{name}_count{{{labels}}} {total}'
+
+    def export(self):
+        """Текст в формате Prometheus."""
+        with self._lock:
+            stats = sorted(self._stats.items())
+            lines = [
+                '# HELP api_request_duration_seconds '
+                'Время обработки запроса.',
+                '# TYPE api_request_duration_seconds histogram',
+            ]
+            for (view, method), endpoint in stats:
+                lines.extend(self._histogram_lines(
+                    'api_request_duration_seconds',
+                    _labels(view, method), endpoint.duration,
+                ))
+            lines += [
+                '# HELP api_request_db_queries SQL-запросов за запрос.',
+                '# TYPE api_request_db_queries histogram',
+            ]
+            for (view, method), endpoint in stats:
+                lines.extend(self._histogram_lines(
+                    'api_request_db_queries',
+                    _labels(view, method), endpoint.queries,
+                ))
+            for name, attr, help_text in (
+                ('api_request_db_seconds_total', 'db_time',
+                 'Суммарное время SQL-запросов.'),
+                ('api_request_serialize_seconds_total', 'serialize_time',
+                 'Суммарное время сериализаторов.'),
+            ):
+                lines += [
+                    f'# HELP {name} {help_text}',
+                    f'# TYPE {name} counter',
+                ]
+                lines.extend(
+                    f'{name}{{{_labels(view, method)}}} '
+                    f'{getattr(endpoint, attr)}'
+                    for (view, method), endpoint in stats
+                )
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(view, method):
+    view = view.replace('\\', '\\\\').replace('"', '\\"')
+    return f'view="{view}",method="{method}"'
+
+
+registry = Registry()
+
+
+def _server_timing(metrics, duration):
+    return (
+        f'db;desc="{metrics.queries} queries";'
+        f'dur={metrics.db_time * 1000:.1f}, '
+        f'serialize;dur={metrics.serialize_time * 1000:.1f}, '
+        f'total;dur={duration * 1000:.1f}'
+    )
+
+
+class MetricsMiddleware:
+    """Собирает метрики запроса и отдаёт их в Server-Timing."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = _local.metrics = RequestMetrics()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.record_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            _local.metrics = None
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else UNRESOLVED
+        registry.observe(view, request.method, duration, metrics)
+        response.headers['Server-Timing'] = _server_timing(metrics, duration)
+        if (
+            settings.SLOW_REQUEST_MS
+            and duration * 1000 >= settings.SLOW_REQUEST_MS
+        ) or (
+            settings.SLOW_REQUEST_QUERIES
+            and metrics.queries >= settings.SLOW_REQUEST_QUERIES
+        ):
+            logger.warning(
+                'Медленный запрос %s %s (%s): %.0f мс, SQL-запросов %d '
+                'за %.0f мс, сериализация %.0f мс',
+                request.method, request.get_full_path(), view,
+                duration * 1000, metrics.queries, metrics.db_time * 1000,
+                metrics.serialize_time * 1000,
+            )
+        return response
+
+
+def metrics_view(request):
+    """Метрики для Prometheus.
+
+    Доступны по Bearer-токену METRICS_TOKEN или сотрудникам, вошедшим
+    в админку. Без токена в настройках остаётся только второй способ.
+    """
+    token = settings.METRICS_TOKEN
+    if not (
+        token and constant_time_compare(
+            request.headers.get('Authorization', ''), f'Bearer {token}'
+        )
+        or request.user.is_staff
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.export(), content_type=CONTENT_TYPE)
@@ -1,7 +1,18 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import (
+    CursorPagination,
+    PageNumberPagination,
+)
 
 
 class PerPagePagination(PageNumberPagination):
 
     page_size = 6
     page_size_query_param = "limit"
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсорная пагинация ленты рецептов без OFFSET и COUNT(*)."""
+
+    page_size = 6
+    page_size_query_param = "limit"
+    ordering = ("-pub_date", "-id")
@@ -0,0 +1,232 @@
+"""Быстрое представление списков без ModelSerializer.
+
+Ответы /api/recipes/, /api/ingredients/ и /api/users/subscriptions/
+собираются из строк values() и заранее сгруппированных словарей: объекты
+моделей и поля DRF не создаются. JSON совпадает байт в байт с тем, что
+выдают RecipeReadSerializer, IngredientSerializer и
+SubscribedAuthorSerializer; это проверяет ValuesListContractTest в
+api/tests.py. Меняя эти сериализаторы, нужно поменять и
+функции здесь.
+"""
+from collections import defaultdict
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from rest_framework.response import Response
+
+from recipes.models import Recipe, RecipeIngredient, User
+from .fields import image_derivatives
+from .metrics import serializing
+from .serializers import UserSerializer
+
+USER_VALUES = ('id', 'username', 'first_name', 'last_name', 'email',
+               'avatar')
+RECIPE_VALUES = ('id', 'name', 'image', 'images_ready', 'text',
+                 'cooking_time', 'pub_date',
+                 *(f'author__{field}' for field in USER_VALUES))
+USER_STATE_VALUES = ('is_favorited', 'is_in_shopping_cart')
+SHORT_RECIPE_VALUES = ('id', 'name', 'image', 'images_ready',
+                       'cooking_time')
+INGREDIENT_VALUES = ('id', 'name', 'unit')
+
+IMAGE_STORAGE = Recipe._meta.get_field('image').storage
+AVATAR_STORAGE = User._meta.get_field('avatar').storage
+
+
+def _absolute_url(request):
+    """То же, что request.build_absolute_uri, но без разбора адреса."""
+    if request is None:
+        return None
+    prefix = request.build_absolute_uri('/')[:-1]
+
+    def absolute_url(url):
+        if url.startswith('/') and not url.startswith('//'):
+            return prefix + url
+        return request.build_absolute_uri(url)
+
+    return absolute_url
+
+
+def _file_url(storage, name, absolute_url):
+    if not name:
+        return None
+    url = storage.url(name)
+    return absolute_url(url) if absolute_url else url
+
+
+def _user(row, prefix, is_subscribed, absolute_url):
+    return {
+        'username': row[f'{prefix}username'],
+        'first_name': row[f'{prefix}first_name'],
+        'last_name': row[f'{prefix}last_name'],
+        'id': row[f'{prefix}id'],
+        'email': row[f'{prefix}email'],
+        'is_subscribed': is_subscribed,
+        'avatar': _file_url(
+            AVATAR_STORAGE, row[f'{prefix}avatar'], absolute_url
+        ),
+    }
+
+
+def _image(row, absolute_url):
+    name = row['image']
+    return (
+        _file_url(IMAGE_STORAGE, name, absolute_url),
+        image_derivatives(name, absolute_url)
+        if name and row['images_ready'] else None,
+    )
+
+
+def _group_tags(recipe_ids):
+    tags = defaultdict(list)
+    for recipe_id, tag_id, name, slug in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('tag__name').values_list(
+        'recipe_id', 'tag_id', 'tag__name', 'tag__slug'
+    ):
+        tags[recipe_id].append({'id': tag_id, 'name': name, 'slug': slug})
+    return tags
+
+
+def _group_ingredients(recipe_ids):
+    ingredients = defaultdict(list)
+    for recipe_id, ingredient_id, name, amount, unit in (
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+        .order_by('pk')
+        .values_list('recipe_id', 'ingredient_id', 'ingredient__name',
+                     'amount', 'ingredient__unit')
+    ):
+        ingredients[recipe_id].append({
+            'id': ingredient_id,
+            'name': name,
+            'amount': amount,
+            'measurement_unit': unit,
+        })
+    return ingredients
+
+
+def recipe_list(rows, request):
+    """Как RecipeReadSerializer(many=True) для строк values(RECIPE_VALUES).
+
+    Для авторизованного пользователя в строках нужны и USER_STATE_VALUES.
+    """
+    recipe_ids = [row['id'] for row in rows]
+    tags = _group_tags(recipe_ids)
+    ingredients = _group_ingredients(recipe_ids)
+    absolute_url = _absolute_url(request)
+    authenticated = request.user.is_authenticated
+    subscribed = (
+        UserSerializer._subscribed_author_ids(request) if authenticated
+        else ()
+    )
+    authors = {}
+    data = []
+    for row in rows:
+        author_id = row['author__id']
+        if author_id not in authors:
+            authors[author_id] = _user(
+                row, 'author__',
+                authenticated and author_id in subscribed, absolute_url,
+            )
+        image, images = _image(row, absolute_url)
+        data.append({
+            'id': row['id'],
+            'tags': tags.get(row['id'], []),
+            'author': authors[author_id],
+            'ingredients': ingredients.get(row['id'], []),
+            'is_favorited': row.get('is_favorited', False),
+            'is_in_shopping_cart': row.get('is_in_shopping_cart', False),
+            'name': row['name'],
+            'image': image,
+            'images': images,
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+        })
+    return data
+
+
+def ingredient_list(ingredients):
+    """Как IngredientSerializer(many=True) для моделей или строк values()."""
+    return [
+        ingredient if isinstance(ingredient, dict) else {
+            'id': ingredient.id,
+            'name': ingredient.name,
+            'unit': ingredient.unit,
+        }
+        for ingredient in ingredients
+    ]
+
+
+def author_recipes(author_ids, limit=None):
+    """Рецепты авторов для подписок: {автор: строки}, не больше limit."""
+    recipes = Recipe.objects.filter(author_id__in=author_ids)
+    if limit is not None:
+        recipes = recipes.annotate(row_number=Window(
+            RowNumber(),
+            partition_by=F('author_id'),
+            order_by=Recipe._meta.ordering,
+        )).filter(row_number__lte=limit)
+    grouped = defaultdict(list)
+    for row in recipes.values('author_id', *SHORT_RECIPE_VALUES):
+        grouped[row['author_id']].append(row)
+    return grouped
+
+
+def subscription_list(rows, recipes, request):
+    """Как SubscribedAuthorSerializer(many=True) для авторов, на которых
+    подписан пользователь: строки values(USER_VALUES, 'recipes_count')
+    и рецепты из author_recipes."""
+    absolute_url = _absolute_url(request)
+    data = []
+    for row in rows:
+        recipe_data = []
+        for recipe in recipes.get(row['id'], ()):
+            image, images = _image(recipe, absolute_url)
+            recipe_data.append({
+                'id': recipe['id'],
+                'name': recipe['name'],
+                'image': image,
+                'images': images,
+                'cooking_time': recipe['cooking_time'],
+            })
+        data.append({
+            **_user(row, '', True, absolute_url),
+            'recipes': recipe_data,
+            'recipes_count': row['recipes_count'],
+        })
+    return data
+
+
+class ValuesListMixin:
+    """list из строк get_list_rows, собранных represent_list.
+
+    Страница выбирается из values() как обычно, а вместо сериализатора
+    данные собирает represent_list. Подкласс обязан определить:
+
+    - get_list_rows(queryset) — строки values() или список для страницы;
+    - represent_list(rows) — данные ответа для строк страницы.
+
+    Без них класс не создаётся: ошибка видна при импорте, а не на первом
+    запросе.
+    """
+    list_hooks = ('get_list_rows', 'represent_list')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        missing = [
+            name for name in cls.list_hooks
+            if not callable(getattr(cls, name, None))
+        ]
+        if missing:
+            raise TypeError(
+                f'{cls.__name__} должен определить {", ".join(missing)}.'
+            )
+
+    def list(self, request, *args, **kwargs):
+        rows = self.get_list_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        with serializing():
+            data = self.represent_list(rows if page is None else page)
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
@@ -1,10 +1,18 @@
 from collections import Counter
 
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserSerializer as DjoserBaseUserSerializer
 from rest_framework import serializers
 
-from recipes.constants import MIN_COOKING_TIME, MIN_INGREDIENT_AMOUNT
+from recipes import counters, shopping_list
+from recipes.constants import (
+    MAX_BULK_IDS,
+    MAX_PANTRY_INGREDIENTS,
+    MIN_COOKING_TIME,
+    MIN_INGREDIENT_AMOUNT,
+)
+from recipes.images import generate_derivatives
 from recipes.models import (
     Ingredient,
     Recipe,
@@ -13,10 +21,11 @@ from recipes.models import (
     Tag,
     User,
 )
-from .fields import Base64ImageField
+from .fields import Base64ImageField, ImageDerivativesField
+from .metrics import TimedSerializerMixin
 
 
-class UserSerializer(DjoserBaseUserSerializer):
+class UserSerializer(TimedSerializerMixin, DjoserBaseUserSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = Base64ImageField(required=False)
 
@@ -30,28 +39,36 @@ class UserSerializer(DjoserBaseUserSerializer):
         request = self.context.get('request')
         return (
             request.user.is_authenticated
-            and Subscription.objects.filter(
-                user=request.user, author=obj).exists()
+            and obj.id in self._subscribed_author_ids(request)
         )
 
+    @staticmethod
+    def _subscribed_author_ids(request):
+        """Id авторов, на которых подписан пользователь, один раз на запрос."""
+        if not hasattr(request, 'subscribed_author_ids'):
+            request.subscribed_author_ids = set(
+                Subscription.objects.filter(
+                    user=request.user
+                ).values_list('author_id', flat=True)
+            )
+        return request.subscribed_author_ids
+
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = '__all__'
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = '__all__'
 
 
 class IngredientMeasureSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        source='ingredient'
-    )
+    # Ингредиенты по id загружает RecipeWriteSerializer одним запросом.
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(min_value=MIN_INGREDIENT_AMOUNT)
 
     class Meta:
@@ -59,18 +76,40 @@ class IngredientMeasureSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    images = ImageDerivativesField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
         read_only_fields = fields
 
 
+class RecipeCoverageSerializer(RecipeShortSerializer):
+    """Рецепт с долей имеющихся ингредиентов и числом недостающих."""
+    coverage = serializers.FloatField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeShortSerializer.Meta):
+        fields = (*RecipeShortSerializer.Meta.fields, 'coverage', 'missing')
+        read_only_fields = fields
+
+
+class PantrySerializer(serializers.Serializer):
+    """Параметры поиска рецептов по имеющимся ингредиентам."""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_PANTRY_INGREDIENTS,
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+
+
 class SubscribedAuthorSerializer(UserSerializer):
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='recipes.count', read_only=True
+    recipes = RecipeShortSerializer(
+        many=True, read_only=True, source='limited_recipes'
     )
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(UserSerializer.Meta):
         fields = (
@@ -80,16 +119,6 @@ class SubscribedAuthorSerializer(UserSerializer):
         )
         read_only_fields = fields
 
-    def get_recipes(self, user):
-        request = self.context.get('request')
-        limit = request.query_params.get('recipes_limit', 10**10)
-        try:
-            limit = int(limit)
-        except (ValueError, TypeError):
-            limit = 10**10
-        recipes = user.recipes.all()[:limit]
-        return RecipeShortSerializer(recipes, many=True).data
-
 
 class IngredientReadSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='ingredient.id')
@@ -102,7 +131,7 @@ class IngredientReadSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(read_only=True)
     ingredients = IngredientReadSerializer(
@@ -112,27 +141,33 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    images = ImageDerivativesField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time'
+            'name', 'image', 'images', 'text', 'cooking_time'
         )
         read_only_fields = fields
 
-    def _is_related(self, recipe: Recipe, related_name: str):
+    def _is_related(self, recipe: Recipe, related_name: str,
+                    annotation: str):
         user = self.context.get('request').user
         if not user.is_authenticated:
             return False
+        annotated = getattr(recipe, annotation, None)
+        if annotated is not None:
+            return annotated
         return getattr(recipe, related_name).filter(user=user).exists()
 
     def get_is_favorited(self, recipe: Recipe):
-        return self._is_related(recipe, 'in_favorites')
+        return self._is_related(recipe, 'in_favorites', 'is_favorited')
 
     def get_is_in_shopping_cart(self, recipe: Recipe):
-        return self._is_related(recipe, 'in_shoppingcarts')
+        return self._is_related(
+            recipe, 'in_shoppingcarts', 'is_in_shopping_cart')
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
@@ -150,6 +185,25 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             'name', 'text', 'cooking_time'
         )
 
+    def validate_ingredients(self, ingredients_data):
+        """Заменяет id ингредиентов объектами, загруженными одним запросом."""
+        found = Ingredient.objects.in_bulk(
+            {item['id'] for item in ingredients_data}
+        )
+        messages = serializers.PrimaryKeyRelatedField.default_error_messages
+        errors = [
+            {} if item['id'] in found else {'id': [
+                messages['does_not_exist'].format(pk_value=item['id'])
+            ]}
+            for item in ingredients_data
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return [
+            {'ingredient': found[item['id']], 'amount': item['amount']}
+            for item in ingredients_data
+        ]
+
     def validate(self, data):
         ingredients_data = data.get('ingredients')
         tags_data = data.get('tags')
@@ -184,6 +238,8 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def _bulk_create_ingredients(recipe: Recipe, ingredients_data: list[dict]):
+        if not ingredients_data:
+            return
         RecipeIngredient.objects.bulk_create([
             RecipeIngredient(
                 recipe=recipe,
@@ -198,18 +254,89 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         ingredients_data = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = super().create(validated_data)
+        generate_derivatives.delay(recipe.image.name)
+        counters.increment(
+            User.objects.filter(pk=recipe.author_id), 'recipes_count'
+        )
         recipe.tags.set(tags)
         self._bulk_create_ingredients(recipe, ingredients_data)
         return recipe
 
+    def _update_ingredients(self, recipe: Recipe,
+                            ingredients_data: list[dict]):
+        """Приводит состав рецепта к ingredients_data, трогая только отличия.
+
+        Возвращает прежний и новый состав в виде {ingredient_id: amount}.
+        """
+        existing = {
+            item.ingredient_id: item
+            for item in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in existing.items()
+        }
+        new_amounts = {
+            item['ingredient'].id: item['amount'] for item in ingredients_data
+        }
+        removed = [
+            item.pk for ingredient_id, item in existing.items()
+            if ingredient_id not in new_amounts
+        ]
+        if removed:
+            RecipeIngredient.objects.filter(pk__in=removed).delete()
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            item = existing.get(ingredient_id)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        self._bulk_create_ingredients(recipe, [
+            item for item in ingredients_data
+            if item['ingredient'].id not in existing
+        ])
+        return old_amounts, new_amounts
+
     @transaction.atomic
     def update(self, instance: Recipe, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        instance.ingredient_amounts.all().delete()
         instance.tags.set(tags)
-        self._bulk_create_ingredients(instance, ingredients_data)
-        return super().update(instance, validated_data)
+        old_amounts, new_amounts = self._update_ingredients(
+            instance, ingredients_data
+        )
+        shopping_list.change_recipe(instance.id, old_amounts, new_amounts)
+        if 'image' in validated_data:
+            validated_data['images_ready'] = False
+        recipe = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            generate_derivatives.delay(recipe.image.name)
+        return recipe
 
     def to_representation(self, recipe: Recipe):
+        # После сохранения кэш prefetch сброшен: загружаем связи заново
+        # вместе с ингредиентами, а не по запросу на строку состава.
+        prefetch_related_objects(
+            [recipe],
+            'tags',
+            Prefetch(
+                'ingredient_amounts',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ).order_by('pk'),
+            ),
+        )
         return RecipeReadSerializer(recipe, context=self.context).data
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для пакетных операций; повторы отбрасываются."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_IDS,
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
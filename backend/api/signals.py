@@ -0,0 +1,70 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag, User
+from .cache import invalidate, recipe_scopes
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    invalidate(recipe_ids=[instance.pk])
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    # Теги рецепта удаляются вместе с ним, поэтому области считаем заранее.
+    invalidate(scopes=recipe_scopes([instance.pk]))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    invalidate(recipe_ids=[instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if reverse:
+        recipe_ids = (
+            instance.recipes.values_list('id', flat=True)
+            if action == 'pre_clear' else pk_set or ()
+        )
+        invalidate(recipe_ids=recipe_ids, scopes=[f'tag:{instance.slug}'])
+    elif action in ('pre_remove', 'pre_clear'):
+        invalidate(scopes=recipe_scopes([instance.pk]))
+    elif action.startswith('post_'):
+        invalidate(recipe_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    invalidate(
+        recipe_ids=instance.recipes.values_list('id', flat=True),
+        scopes=[f'tag:{instance.slug}'],
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    invalidate(recipe_ids=instance.recipes.values_list('id', flat=True))
+    ingredient_index.invalidate()
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate(author_ids=[instance.pk])
@@ -0,0 +1,271 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import mixins, status
+from rest_framework.test import APITestCase
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem,
+    Subscription,
+    Tag,
+    User,
+)
+from . import views
+from .representations import ValuesListMixin
+from .serializers import SubscribedAuthorSerializer
+
+
+class RecipeUpdateQueriesTest(APITestCase):
+    """Число запросов PATCH рецепта не зависит от числа ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            'author', 'author@example.com', 'password'
+        )
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', unit='г')
+            for number in range(42)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.author)
+
+    def _create_recipe(self, ingredients):
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name='Рецепт',
+            image='recipes/images/test.png',
+            text='Описание',
+            cooking_time=10,
+        )
+        recipe.tags.set([self.tag])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        return recipe
+
+    def _patch(self, size):
+        """Меняет количества, убирает один ингредиент и добавляет другой."""
+        recipe = self._create_recipe(self.ingredients[:size])
+        ingredients = [
+            {'id': ingredient.pk, 'amount': 2}
+            for ingredient in self.ingredients[1:size + 1]
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/api/recipes/{recipe.pk}/',
+                {'ingredients': ingredients, 'tags': [self.tag.pk]},
+                format='json',
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            dict(recipe.ingredient_amounts.values_list(
+                'ingredient_id', 'amount'
+            )),
+            {item['id']: item['amount'] for item in ingredients},
+        )
+        return len(queries)
+
+    def test_queries_do_not_depend_on_ingredient_count(self):
+        self.assertEqual(self._patch(2), self._patch(40))
+
+
+class BulkRaceTest(APITestCase):
+    """Строку, созданную параллельным запросом, пакетное добавление
+    не учитывает второй раз."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            'user', 'user@example.com', 'password'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                f'author{number}', f'author{number}@example.com', 'password'
+            )
+            for number in range(2)
+        ]
+        cls.ingredient = Ingredient.objects.create(name='Мука', unit='г')
+        cls.recipes = []
+        for number in range(2):
+            recipe = Recipe.objects.create(
+                author=cls.authors[0],
+                name=f'Рецепт {number}',
+                image='recipes/images/test.png',
+                text='Описание',
+                cooking_time=10,
+            )
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=cls.ingredient, amount=100
+            )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def _racing(self, create):
+        """insert_missing, перед которым успевает параллельный запрос."""
+        insert_missing = views.insert_missing
+
+        def racing(*args):
+            create()
+            return insert_missing(*args)
+
+        return mock.patch.object(views, 'insert_missing', racing)
+
+    def test_shopping_cart(self):
+        first, second = self.recipes
+        with self._racing(lambda: ShoppingCart.objects.create(
+            user=self.user, recipe=first
+        )):
+            response = self.client.post(
+                '/api/recipes/shopping_cart/bulk/',
+                {'ids': [first.pk, second.pk]}, format='json',
+            )
+        self.assertEqual(
+            response.data, {first.pk: 'exists', second.pk: 'created'}
+        )
+        self.assertEqual(
+            dict(Recipe.objects.values_list('pk', 'shopping_carts_count')),
+            {first.pk: 0, second.pk: 1},
+        )
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=self.user).amount, 100
+        )
+
+    def test_subscriptions(self):
+        first, second = self.authors
+        with self._racing(lambda: Subscription.objects.create(
+            user=self.user, author=first
+        )):
+            response = self.client.post(
+                '/api/users/subscribe/bulk/',
+                {'ids': [first.pk, second.pk]}, format='json',
+            )
+        self.assertEqual(
+            response.data, {first.pk: 'exists', second.pk: 'created'}
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.subscriptions_count, 1)
+        self.assertEqual(
+            dict(User.objects.filter(
+                pk__in=(first.pk, second.pk)
+            ).values_list('pk', 'followers_count')),
+            {first.pk: 0, second.pk: 1},
+        )
+
+
+def serialized_subscriptions(view, request):
+    """subscriptions через SubscribedAuthorSerializer, как до
+    api.representations."""
+    page = view.paginate_queryset(
+        view.get_authors_with_recipes().filter(authors__user=request.user)
+    )
+    return view.get_paginated_response(SubscribedAuthorSerializer(
+        page, many=True, context={'request': request}
+    ).data)
+
+
+class ValuesListContractTest(APITestCase):
+    """Быстрые списки совпадают с ответами сериализаторов байт в байт."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            'user', 'user@example.com', 'password'
+        )
+        cls.author = User.objects.create_user(
+            'author', 'author@example.com', 'password',
+            first_name='Автор', avatar='users/avatars/author.png',
+        )
+        cls.other = User.objects.create_user(
+            'other', 'other@example.com', 'password'
+        )
+        Subscription.objects.bulk_create([
+            Subscription(user=cls.user, author=cls.author),
+            Subscription(user=cls.user, author=cls.other),
+        ])
+        tags = [
+            Tag.objects.create(name=name, slug=slug)
+            for name, slug in (('Ужин', 'dinner'), ('Завтрак', 'breakfast'))
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}', unit='г')
+            for number in range(3)
+        ]
+        recipes = []
+        for number in range(8):
+            recipe = Recipe.objects.create(
+                author=(cls.author, cls.other, cls.user)[number % 3],
+                name=f'Рецепт {number}',
+                image=f'recipes/images/{number}.png',
+                images_ready=number % 2 == 0,
+                text='Описание',
+                cooking_time=5 + number,
+            )
+            recipe.tags.set(tags[:number % 3])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+                for ingredient in ingredients[number % 2:]
+            )
+            recipes.append(recipe)
+        Favorite.objects.create(user=cls.user, recipe=recipes[0])
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.user, recipe=recipe)
+            for recipe in recipes[:3]
+        )
+        User.objects.filter(pk=cls.author.pk).update(recipes_count=3)
+        User.objects.filter(pk=cls.other.pk).update(recipes_count=3)
+
+    def _get(self, path, params):
+        cache.clear()
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content
+
+    def _assert_same(self, path, params):
+        fast = self._get(path, params)
+        with mock.patch.object(
+            ValuesListMixin, 'list', mixins.ListModelMixin.list
+        ), mock.patch.object(
+            views.UserViewSet, 'subscriptions', serialized_subscriptions
+        ):
+            self.assertEqual(fast, self._get(path, params))
+
+    def test_anonymous(self):
+        for path, params in (
+            ('/api/recipes/', {}),
+            ('/api/recipes/', {'limit': 3, 'page': 2}),
+            ('/api/recipes/', {'cursor': '', 'limit': 3}),
+            ('/api/ingredients/', {}),
+            ('/api/ingredients/', {'name': 'Ингредиент'}),
+        ):
+            with self.subTest(path=path, params=params):
+                self._assert_same(path, params)
+
+    def test_authenticated(self):
+        self.client.force_authenticate(self.user)
+        for path, params in (
+            ('/api/recipes/', {}),
+            ('/api/recipes/', {'cursor': '', 'limit': 3}),
+            ('/api/recipes/', {'is_in_shopping_cart': 1}),
+            ('/api/ingredients/', {}),
+            ('/api/users/subscriptions/', {}),
+            ('/api/users/subscriptions/', {'recipes_limit': 1}),
+            ('/api/users/subscriptions/', {'recipes_limit': 2, 'limit': 1}),
+        ):
+            with self.subTest(path=path, params=params):
+                self._assert_same(path, params)
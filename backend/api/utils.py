@@ -1,37 +1,118 @@
+import csv
+import io
+import json
 from datetime import date
 
-from django.template.loader import render_to_string
-from django.http import FileResponse
-from django.db.models import Sum
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.formats import date_format
+from django.utils.text import capfirst
+from rest_framework.test import APIRequestFactory
 
-from recipes.models import Recipe, RecipeIngredient
+from recipes.models import Recipe, ShoppingListItem
+from recipes.templatetags.units import pluralize_unit
 
+CHUNK_SIZE = 2000
 
-def generate_shopping_list(user):
-    """Функция для создания списка покупок."""
-    recipes_qs = Recipe.objects.filter(in_shoppingcarts__user=user)
+CONTENT_TYPES = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+}
 
+
+def command_request_factory():
+    """APIRequestFactory для запросов из management-команд.
+
+    Хост берётся из ALLOWED_HOSTS: с именем testserver по умолчанию
+    request.get_host() отклоняет запрос вне тестов.
+    """
+    host = settings.ALLOWED_HOSTS[0].lstrip('.')
+    return APIRequestFactory(
+        SERVER_NAME='localhost' if host == '*' else host
+    )
+
+
+def get_shopping_list(user):
+    """Ингредиенты и рецепты из корзины пользователя."""
+    recipes = Recipe.objects.filter(in_shoppingcarts__user=user)
     ingredients = (
-        RecipeIngredient.objects
-        .filter(recipe__in=recipes_qs)
-        .values('ingredient__name', 'ingredient__unit')
-        .annotate(total_amount=Sum('amount'))
+        ShoppingListItem.objects
+        .filter(user=user)
+        .values_list('ingredient__name', 'ingredient__unit', 'amount')
         .order_by('ingredient__name')
     )
+    return (
+        ingredients.iterator(chunk_size=CHUNK_SIZE),
+        recipes.values_list('name', 'author__username').iterator(
+            chunk_size=CHUNK_SIZE
+        ),
+    )
+
 
-    recipes = recipes_qs.values_list('name', 'author__username')
+def _rows(ingredients):
+    for name, unit, amount in ingredients:
+        yield capfirst(name), amount, pluralize_unit(unit, amount)
 
-    context = {
-        'date': date.today(),
-        'ingredients': ingredients,
-        'recipes': recipes,
-    }
 
-    content = render_to_string('shopping_list.txt', context)
+def _stream_txt(ingredients, recipes):
+    yield (
+        f'Список покупок от {date_format(date.today(), "j E Y года")}\n\n'
+        'Продукты:\n'
+    )
+    for number, (name, amount, unit) in enumerate(_rows(ingredients), 1):
+        yield f'{number}. {name} — {amount} {unit}\n'
+    yield '\nРецепты:\n'
+    for name, author in recipes:
+        yield f'- {name} (автор: {author})\n'
+
 
-    return FileResponse(
-        content,
-        as_attachment=True,
-        filename='shopping_list.txt',
-        content_type='text/plain'
+def _stream_csv(ingredients, recipes):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('Продукт', 'Количество', 'Ед. изм.'))
+    for row in _rows(ingredients):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _stream_json(ingredients, recipes):
+    yield f'{{"date": "{date.today().isoformat()}", "ingredients": ['
+    separator = ''
+    for name, amount, unit in _rows(ingredients):
+        item = {'name': name, 'amount': amount, 'measurement_unit': unit}
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ', '
+    yield '], "recipes": ['
+    separator = ''
+    for name, author in recipes:
+        item = {'name': name, 'author': author}
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ', '
+    yield ']}'
+
+
+STREAMS = {
+    'txt': _stream_txt,
+    'csv': _stream_csv,
+    'json': _stream_json,
+}
+
+
+def generate_shopping_list(user, file_format='txt'):
+    """Функция для создания списка покупок.
+
+    Строки выбираются курсором и отдаются по мере формирования, поэтому
+    список не собирается в памяти целиком.
+    """
+    response = StreamingHttpResponse(
+        STREAMS[file_format](*get_shopping_list(user)),
+        content_type=CONTENT_TYPES[file_format],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{file_format}"'
     )
+    return response
@@ -1,9 +1,10 @@
 from django.shortcuts import get_object_or_404
-from django.db import IntegrityError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Exists, OuterRef, Prefetch
 from django.urls import reverse
 from rest_framework import status, viewsets, serializers
 from rest_framework.decorators import action
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import (
     AllowAny,
     IsAuthenticated,
@@ -13,39 +14,159 @@ from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from djoser.views import UserViewSet as DjoserUserView
 
+from recipes import counters, shopping_list, versions
+from recipes.images import generate_derivatives
+from recipes.coverage import coverage_index
+from recipes.ingredient_index import ingredient_index
+from recipes.short_links import make_code, recipe_ids
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
+    RecipeIngredient,
     ShoppingCart,
     Subscription,
     Tag,
     User,
 )
 from .serializers import (
+    BulkIdsSerializer,
+    PantrySerializer,
+    RecipeCoverageSerializer,
     SubscribedAuthorSerializer,
     IngredientSerializer,
     RecipeReadSerializer,
     RecipeWriteSerializer,
     TagSerializer,
 )
-from .filters import RecipeFilter, IngredientSearchFilter
+from .cache import AnonymousCacheMixin
+from .conditional import (
+    ConditionalGetMixin,
+    make_etag,
+    version_timestamp,
+)
+from .filters import RecipeFilter
+from .metrics import serializing
+from .pagination import PerPagePagination, RecipeCursorPagination
+from .renderers import SHOPPING_LIST_RENDERERS
+from .representations import (
+    INGREDIENT_VALUES,
+    RECIPE_VALUES,
+    USER_STATE_VALUES,
+    USER_VALUES,
+    ValuesListMixin,
+    author_recipes,
+    ingredient_list,
+    recipe_list,
+    subscription_list,
+)
 from .utils import generate_shopping_list
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+def get_bulk_ids(request):
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data['ids']
+
+
+def insert_missing(model, user, field, ids):
+    """Создаёт связи пользователя с объектами ids, которых ещё нет.
+
+    Возвращает id, для которых строка действительно вставлена: строку,
+    созданную параллельным запросом, ON CONFLICT пропускает и RETURNING
+    её не вернёт, поэтому счётчики и агрегаты не учтут её дважды.
+    """
+    if not ids:
+        return set()
+    quote = connection.ops.quote_name
+    meta = model._meta
+    user_column = quote(meta.get_field('user').column)
+    column = quote(meta.get_field(field).column)
+    values = ', '.join(['(%s, %s)'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(meta.db_table)} ({user_column}, {column}) '
+            f'VALUES {values} ON CONFLICT DO NOTHING RETURNING {column}',
+            [value for pk in ids for value in (user.pk, pk)],
+        )
+        return {pk for pk, in cursor.fetchall()}
+
+
+class RecipeViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                    ValuesListMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.select_related(
         'author'
     ).prefetch_related(
         'tags',
-        'in_favorites',
-        'in_shoppingcarts',
-        'ingredient_amounts__ingredient',
+        Prefetch(
+            'ingredient_amounts',
+            queryset=RecipeIngredient.objects.select_related(
+                'ingredient'
+            ).order_by('pk'),
+        ),
     )
 
     permission_classes = [IsAuthenticatedOrReadOnly]
     filterset_class = RecipeFilter
 
+    @property
+    def pagination_class(self):
+        if (RecipeCursorPagination.cursor_query_param
+                in self.request.query_params):
+            return RecipeCursorPagination
+        return PerPagePagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+        )
+
+    def get_validators(self, request, *args, **kwargs):
+        """Версии справочников и состояния пользователя: рецепт показывает
+        названия тегов и ингредиентов, а также отметки избранного,
+        корзины и подписки. Список добавляет версию ленты, рецепт — дату
+        своего изменения."""
+        user = request.user
+        names = [versions.TAGS, versions.INGREDIENTS]
+        if user.is_authenticated:
+            names.append(versions.user_state(user.pk))
+        updated_at = None
+        if self.action == 'retrieve':
+            try:
+                updated_at = Recipe.objects.filter(
+                    pk=kwargs[self.lookup_field]
+                ).values_list('updated_at', flat=True).first()
+            except (TypeError, ValueError):
+                return None, None
+            if updated_at is None:
+                return None, None
+        else:
+            names.append(versions.RECIPES)
+        current = versions.get_versions(*names)
+        last_modified = version_timestamp(max(current))
+        if updated_at is not None:
+            last_modified = max(last_modified, int(updated_at.timestamp()))
+        return (
+            make_etag(request, user.pk, updated_at, *current),
+            last_modified,
+        )
+
+    def get_list_rows(self, queryset):
+        fields = RECIPE_VALUES
+        if self.request.user.is_authenticated:
+            fields += USER_STATE_VALUES
+        return queryset.prefetch_related(None).values(*fields)
+
+    def represent_list(self, rows):
+        return recipe_list(rows, self.request)
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeReadSerializer
@@ -54,6 +175,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
     def _add_to(self, model, user, pk):
         recipe = get_object_or_404(Recipe, pk=pk)
         _, created = model.objects.get_or_create(user=user, recipe=recipe)
@@ -62,6 +184,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 f'Рецепт "{recipe}" уже добавлен в список'
                 f'{model._meta.verbose_name_plural.lower()}.'
             )
+        counters.increment(
+            Recipe.objects.filter(pk=recipe.pk), model.counter_field
+        )
         return Response(
             RecipeReadSerializer(
                 recipe, context={'request': self.request}).data,
@@ -69,16 +194,60 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
 
     @staticmethod
+    @transaction.atomic
     def _remove_from(model, user, pk):
         get_object_or_404(model, user=user, recipe_id=pk).delete()
+        counters.increment(
+            Recipe.objects.filter(pk=pk), model.counter_field, -1
+        )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @staticmethod
+    def _bulk_add_to(model, user, ids):
+        """Добавляет рецепты в список; возвращает (добавленные id, итоги)."""
+        found = set(
+            Recipe.objects.filter(pk__in=ids).values_list('pk', flat=True)
+        )
+        added = insert_missing(model, user, 'recipe', found)
+        if added:
+            versions.bump(versions.user_state(user.pk))
+            counters.increment(
+                Recipe.objects.filter(pk__in=added), model.counter_field
+            )
+        return added, {
+            pk: (
+                'created' if pk in added
+                else 'exists' if pk in found
+                else 'not_found'
+            )
+            for pk in ids
+        }
+
+    @staticmethod
+    def _bulk_remove_from(model, user, ids):
+        """Убирает рецепты из списка; возвращает (убранные id, итоги)."""
+        rows = dict(model.objects.select_for_update().filter(
+            user=user, recipe_id__in=ids
+        ).values_list('recipe_id', 'pk'))
+        if rows:
+            model.objects.filter(pk__in=rows.values()).delete()
+            counters.increment(
+                Recipe.objects.filter(pk__in=rows), model.counter_field, -1
+            )
+        return set(rows), {
+            pk: 'deleted' if pk in rows else 'not_found' for pk in ids
+        }
+
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_short_link(self, request, pk=None):
-        if not Recipe.objects.filter(pk=pk).exists():
-            raise ValidationError(f'Рецепт с id={pk} не найден.')
+        try:
+            recipe_id = int(pk)
+        except ValueError:
+            recipe_id = None
+        if recipe_id is None or recipe_id not in recipe_ids:
+            raise NotFound(f'Рецепт с id={pk} не найден.')
         short_url = request.build_absolute_uri(
-            reverse('short_link', args=[pk])
+            reverse('short_link', args=[make_code(recipe_id)])
         )
         return Response({'short-link': short_url})
 
@@ -93,33 +262,127 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'], url_path='shopping_cart',
             permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def add_to_shopping_cart(self, request, pk=None):
-        return self._add_to(ShoppingCart, request.user, pk)
+        response = self._add_to(ShoppingCart, request.user, pk)
+        shopping_list.add_recipes(request.user, [pk])
+        return response
 
     @add_to_shopping_cart.mapping.delete
+    @transaction.atomic
     def remove_from_shopping_cart(self, request, pk=None):
-        return self._remove_from(ShoppingCart, request.user, pk)
+        response = self._remove_from(ShoppingCart, request.user, pk)
+        shopping_list.remove_recipes(request.user, [pk])
+        return response
 
-    @action(detail=False, methods=['get'], url_path='download_shopping_cart',
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='favorite/bulk', permission_classes=[IsAuthenticated])
+    @transaction.atomic
+    def bulk_favorite(self, request):
+        ids = get_bulk_ids(request)
+        change = (
+            self._bulk_remove_from if request.method == 'DELETE'
+            else self._bulk_add_to
+        )
+        _, results = change(Favorite, request.user, ids)
+        return Response(results)
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart/bulk',
             permission_classes=[IsAuthenticated])
+    @transaction.atomic
+    def bulk_shopping_cart(self, request):
+        ids = get_bulk_ids(request)
+        if request.method == 'DELETE':
+            removed, results = self._bulk_remove_from(
+                ShoppingCart, request.user, ids
+            )
+            if removed:
+                shopping_list.remove_recipes(request.user, removed)
+        else:
+            added, results = self._bulk_add_to(
+                ShoppingCart, request.user, ids
+            )
+            if added:
+                shopping_list.add_recipes(request.user, added)
+        return Response(results)
+
+    @action(detail=False, methods=['get'], url_path='by_ingredients',
+            permission_classes=[AllowAny])
+    def by_ingredients(self, request):
+        """Рецепты, которые можно приготовить из указанных ингредиентов."""
+        params = PantrySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        paginator = PerPagePagination()
+        page = paginator.paginate_queryset(
+            coverage_index.search(
+                params.validated_data['ingredients'],
+                params.validated_data.get('max_missing'),
+            ),
+            request, self
+        )
+        recipes = Recipe.objects.in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        deleted = [
+            recipe_id for recipe_id, _, _ in page if recipe_id not in recipes
+        ]
+        if deleted:
+            coverage_index.forget(deleted)
+        results = []
+        for recipe_id, matched, needed in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.coverage = round(matched / needed, 3)
+            recipe.missing = needed - matched
+            results.append(recipe)
+        return paginator.get_paginated_response(RecipeCoverageSerializer(
+            results, many=True, context={'request': request}
+        ).data)
+
+    @action(detail=False, methods=['get'], url_path='download_shopping_cart',
+            permission_classes=[IsAuthenticated],
+            renderer_classes=SHOPPING_LIST_RENDERERS)
     def download_shopping_cart(self, request):
-        return generate_shopping_list(request.user)
+        return generate_shopping_list(
+            request.user, request.accepted_renderer.format
+        )
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, ValuesListMixin,
+                        ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ('^name',)
     pagination_class = None
+    version_names = (versions.INGREDIENTS,)
 
+    def filter_queryset(self, queryset):
+        query = self.request.query_params
+        if self.action != 'list' or 'name' not in query:
+            return super().filter_queryset(queryset)
+        try:
+            limit = max(int(query['limit']), 0)
+        except (KeyError, ValueError):
+            limit = None
+        return ingredient_index.search(query['name'], limit)
 
-class TagViewSet(ReadOnlyModelViewSet):
+    def get_list_rows(self, queryset):
+        if isinstance(queryset, list):
+            return queryset
+        return queryset.values(*INGREDIENT_VALUES)
+
+    def represent_list(self, rows):
+        return ingredient_list(rows)
+
+
+class TagViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    version_names = (versions.TAGS,)
 
 
 class UserViewSet(DjoserUserView):
@@ -138,47 +401,134 @@ class UserViewSet(DjoserUserView):
             partial=True
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        user = serializer.save()
+        if 'avatar' in serializer.validated_data and user.avatar:
+            generate_derivatives.delay(user.avatar.name, sizes=['preview'])
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def get_recipes_limit(self):
+        """Параметр recipes_limit или None, если он не задан."""
+        try:
+            return max(int(self.request.query_params['recipes_limit']), 0)
+        except (KeyError, ValueError):
+            return None
+
+    def get_authors_with_recipes(self):
+        """Авторы с первыми recipes_limit рецептами каждого."""
+        recipes = Recipe.objects.all()
+        limit = self.get_recipes_limit()
+        if limit is not None:
+            recipes = recipes[:limit]
+        return User.objects.prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
+
     @action(detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        authors = User.objects.filter(authors__user=request.user)
+        authors = User.objects.filter(authors__user=request.user).values(
+            *USER_VALUES, 'recipes_count'
+        )
         page = self.paginate_queryset(authors)
-        serializer = SubscribedAuthorSerializer(
-            page, many=True, context={'request': request}
+        recipes = author_recipes(
+            [author['id'] for author in page], self.get_recipes_limit()
+        )
+        with serializing():
+            data = subscription_list(page, recipes, request)
+        return self.get_paginated_response(data)
+
+    @staticmethod
+    def _change_subscription_counters(user_id, author_id, delta):
+        counters.increment(
+            User.objects.filter(pk=user_id), 'subscriptions_count', delta
+        )
+        counters.increment(
+            User.objects.filter(pk=author_id), 'followers_count', delta
         )
-        return self.get_paginated_response(serializer.data)
 
     @action(
         detail=True,
         methods=['post', 'delete'],
         permission_classes=[IsAuthenticated]
     )
-    def subscribe(self, request, pk=None):
+    def subscribe(self, request, id=None):
         if request.method == 'DELETE':
             subscription = get_object_or_404(
-                Subscription, user=request.user, author_id=pk
+                Subscription, user=request.user, author_id=id
             )
-            subscription.delete()
+            with transaction.atomic():
+                subscription.delete()
+                self._change_subscription_counters(request.user.id, id, -1)
             return Response(
                 {'detail': 'Подписка удалена'},
                 status=status.HTTP_204_NO_CONTENT
             )
 
-        if int(pk) == request.user.id:
+        if int(id) == request.user.id:
             raise serializers.ValidationError(
                 'Нельзя подписаться на самого себя.'
             )
 
         try:
-            Subscription.objects.create(user=request.user, author_id=pk)
+            with transaction.atomic():
+                Subscription.objects.create(user=request.user, author_id=id)
+                self._change_subscription_counters(request.user.id, id, 1)
         except IntegrityError:
-            author = get_object_or_404(User, pk=pk)
+            author = get_object_or_404(User, pk=id)
             raise serializers.ValidationError(
                 f'Вы уже подписаны на пользователя {author.username}.'
             )
         serializer = SubscribedAuthorSerializer(
-            get_object_or_404(User, pk=pk), context={'request': request}
+            get_object_or_404(self.get_authors_with_recipes(), pk=id),
+            context={'request': request}
         )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='subscribe/bulk'
+    )
+    @transaction.atomic
+    def bulk_subscribe(self, request):
+        ids = get_bulk_ids(request)
+        user = request.user
+        if request.method == 'DELETE':
+            # Как в _bulk_remove_from: блокировка не даёт параллельному
+            # запросу удалить те же подписки и уменьшить счётчики дважды.
+            rows = dict(Subscription.objects.select_for_update().filter(
+                user=user, author_id__in=ids
+            ).values_list('author_id', 'pk'))
+            changed, delta = set(rows), -1
+            if changed:
+                Subscription.objects.filter(pk__in=rows.values()).delete()
+            results = {
+                pk: 'deleted' if pk in changed else 'not_found' for pk in ids
+            }
+        else:
+            found = set(User.objects.filter(pk__in=ids).exclude(
+                pk=user.pk
+            ).values_list('pk', flat=True))
+            changed, delta = insert_missing(
+                Subscription, user, 'author', found
+            ), 1
+            if changed:
+                versions.bump(versions.user_state(user.pk))
+            results = {
+                pk: (
+                    'created' if pk in changed
+                    else 'exists' if pk in found
+                    else 'self' if pk == user.pk
+                    else 'not_found'
+                )
+                for pk in ids
+            }
+        if changed:
+            counters.increment(
+                User.objects.filter(pk=user.pk),
+                'subscriptions_count', delta * len(changed)
+            )
+            counters.increment(
+                User.objects.filter(pk__in=changed), 'followers_count', delta
+            )
+        return Response(results)
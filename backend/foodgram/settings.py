@@ -30,11 +30,13 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'django_filters',
     'djoser',
+    'jobs.apps.JobsConfig',
     'recipes.apps.RecipesConfig',
     'api.apps.ApiConfig',
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,6 +70,33 @@ else:
         }
     }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+RECIPE_CACHE_ALIAS = os.getenv('RECIPE_CACHE_ALIAS', 'default')
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 300))
+
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+
+SHORT_LINK_SIGNATURE_LENGTH = int(
+    os.getenv('SHORT_LINK_SIGNATURE_LENGTH', 0)
+)
+SHORT_LINK_IDS_TTL = int(os.getenv('SHORT_LINK_IDS_TTL', 300))
+
+COVERAGE_INDEX_TTL = int(os.getenv('COVERAGE_INDEX_TTL', 3600))
+
+# Пороги журнала медленных запросов; 0 отключает порог.
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+SLOW_REQUEST_QUERIES = int(os.getenv('SLOW_REQUEST_QUERIES', 50))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -0,0 +1,32 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'name',
+        'status',
+        'attempts',
+        'max_attempts',
+        'worker',
+        'run_after',
+        'started_at',
+        'finished_at',
+    )
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'last_error')
+    readonly_fields = (
+        'worker', 'last_error', 'created_at', 'started_at', 'finished_at'
+    )
+    actions = ('retry',)
+
+    @admin.action(description='Повторить выбранные задачи')
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status=Job.Status.RUNNING).update(
+            status=Job.Status.PENDING, attempts=0, run_after=timezone.now()
+        )
+        self.message_user(request, f'Поставлено в очередь: {updated}')
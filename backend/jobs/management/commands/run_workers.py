@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from datetime import timedelta
+
+import django
+from django.core.management.base import BaseCommand
+
+from jobs.worker import claim, execute, requeue_stale
+
+
+class Command(BaseCommand):
+    help = 'Запускает обработчики фоновых задач из очереди в базе.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help='Число параллельно выполняемых задач.'
+        )
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Использовать пул процессов вместо пула потоков.'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза в секундах, когда очередь пуста.'
+        )
+        parser.add_argument(
+            '--stale-after', type=int, default=3600,
+            help='Через сколько секунд выполняемая задача считается '
+                 'брошенной и возвращается в очередь.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и завершиться.'
+        )
+
+    def handle(self, *args, workers, processes, poll_interval, stale_after,
+               once, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        name = f'{socket.gethostname()}:{os.getpid()}'
+
+        requeued, failed = requeue_stale(timedelta(seconds=stale_after))
+        if requeued:
+            self.stdout.write(f'Возвращено в очередь задач: {requeued}')
+        if failed:
+            self.stderr.write(self.style.ERROR(
+                f'Помечено ошибкой брошенных задач: {failed}'
+            ))
+
+        if processes:
+            # Пул с fork создаёт процессы при первом submit, когда
+            # claim() уже открыл соединение: дочерние процессы унаследовали
+            # бы его сокет и закрыли сессию родителя. Процессы spawn
+            # запускаются с чистого листа и настраивают Django сами.
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+        else:
+            pool = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='jobs'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработчик {name} запущен: {workers} '
+            f'{"процессов" if processes else "потоков"}.'
+        ))
+
+        futures = set()
+        with pool:
+            while self.running:
+                free = workers - len(futures)
+                claimed = claim(name, free) if free else []
+                futures |= {
+                    pool.submit(execute, job_id) for job_id in claimed
+                }
+                if not futures:
+                    if once:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                done, futures = wait(
+                    futures, timeout=poll_interval,
+                    return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    try:
+                        self.stdout.write(str(future.result()))
+                    except Exception as exc:
+                        self.stderr.write(self.style.ERROR(
+                            f'Сбой обработчика: {exc}'
+                        ))
+        self.stdout.write('Обработчик остановлен.')
+
+    def stop(self, signum, frame):
+        self.running = False
@@ -0,0 +1,44 @@
+"""Регистрация фоновых задач и постановка их в очередь."""
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+_tasks = {}
+
+
+def task(func):
+    """Разрешает выполнять функцию в обработчике очереди.
+
+    У функции появляется метод delay(*args, **kwargs), который ставит её
+    вызов в очередь. Аргументы должны сериализоваться в JSON.
+    """
+    name = f'{func.__module__}.{func.__qualname__}'
+    _tasks[name] = func
+    func.task_name = name
+    func.delay = lambda *args, **kwargs: enqueue(func, *args, **kwargs)
+    return func
+
+
+def enqueue(func, *args, max_attempts=3, **kwargs):
+    """Ставит вызов задачи в очередь в текущей транзакции."""
+    with transaction.atomic():
+        return Job.objects.create(
+            name=func.task_name,
+            args=list(args),
+            kwargs=kwargs,
+            max_attempts=max_attempts,
+        )
+
+
+def get_task(name):
+    if name not in _tasks:
+        # Импорт модуля регистрирует его задачи.
+        try:
+            import_string(name)
+        except ImportError:
+            pass
+    try:
+        return _tasks[name]
+    except KeyError:
+        raise LookupError(f'Задача {name} не зарегистрирована.')
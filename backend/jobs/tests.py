@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from .models import Job
+from .registry import task
+from .worker import claim, execute, requeue_stale
+
+calls = []
+
+
+@task
+def record(value):
+    calls.append(value)
+
+
+@task
+def broken():
+    raise ValueError('Сбой задачи')
+
+
+class WorkerTest(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def _run(self):
+        """Забирает и выполняет все готовые задачи."""
+        return [execute(job_id) for job_id in claim('test', 10)]
+
+    def test_claim_and_execute(self):
+        job = record.delay(1)
+        (done,) = self._run()
+        self.assertEqual(calls, [1])
+        self.assertEqual(done.pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.worker, 'test')
+        self.assertEqual(self._run(), [])
+
+    def test_retry_until_max_attempts(self):
+        job = broken.delay()
+        for attempt in range(1, 4):
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self._run()
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+            self.assertIn('Сбой задачи', job.last_error)
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertIsNotNone(job.finished_at)
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertEqual(self._run(), [])
+
+    def test_claim_counts_attempt(self):
+        job = record.delay(1)
+        claim('test', 10)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.RUNNING)
+        self.assertEqual(job.attempts, 1)
+
+    def test_requeue_stale_until_max_attempts(self):
+        """Задача, роняющая обработчик, не возвращается бесконечно."""
+        job = record.delay(1, max_attempts=2)
+        for expected in ((1, 0), (0, 1)):
+            claim('test', 10)
+            Job.objects.filter(pk=job.pk).update(
+                started_at=timezone.now() - timedelta(hours=2)
+            )
+            self.assertEqual(requeue_stale(timedelta(hours=1)), expected)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(calls, [])
+        self.assertEqual(claim('test', 10), [])
+
+    def test_requeue_stale_skips_recent(self):
+        record.delay(1)
+        claim('test', 10)
+        self.assertEqual(requeue_stale(timedelta(hours=1)), (0, 0))
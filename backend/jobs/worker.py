@@ -0,0 +1,86 @@
+"""Выборка задач из очереди и их выполнение с повторами."""
+import traceback
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+from .registry import get_task
+
+RETRY_DELAY = timedelta(seconds=10)
+
+
+def claim(worker, limit):
+    """Забирает до limit готовых задач и помечает их выполняемыми.
+
+    Попытка засчитывается сразу: если задача уронит обработчик,
+    requeue_stale увидит её в attempts.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        candidates = list(
+            Job.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=Job.Status.PENDING, run_after__lte=now)
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        claimed = []
+        for job_id in candidates:
+            # Условное обновление защищает от двойной выборки там,
+            # где SELECT ... FOR UPDATE не поддерживается (SQLite).
+            if Job.objects.filter(
+                pk=job_id, status=Job.Status.PENDING
+            ).update(
+                status=Job.Status.RUNNING, worker=worker, started_at=now,
+                attempts=F('attempts') + 1,
+            ):
+                claimed.append(job_id)
+    return claimed
+
+
+def execute(job_id):
+    """Выполняет задачу; при ошибке откладывает повтор или сдаётся."""
+    close_old_connections()
+    job = Job.objects.get(pk=job_id)
+    try:
+        get_task(job.name)(*job.args, **job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.Status.PENDING
+            job.run_after = timezone.now() + RETRY_DELAY * 2 ** (
+                job.attempts - 1
+            )
+        else:
+            job.status = Job.Status.FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = Job.Status.DONE
+        job.finished_at = timezone.now()
+    job.save(update_fields=(
+        'status', 'run_after', 'last_error', 'finished_at'
+    ))
+    close_old_connections()
+    return job
+
+
+def requeue_stale(timeout):
+    """Возвращает в очередь задачи, зависшие у упавших обработчиков.
+
+    Задачи, исчерпавшие попытки, помечаются ошибкой: иначе задача,
+    которая роняет обработчик, возвращалась бы в очередь бесконечно.
+    Возвращает (возвращено в очередь, помечено ошибкой).
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.Status.RUNNING, started_at__lt=now - timeout
+    )
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.Status.FAILED, finished_at=now,
+        last_error='Обработчик прервался, не завершив задачу.',
+    )
+    requeued = stale.update(status=Job.Status.PENDING, worker='')
+    return requeued, failed
@@ -1,7 +1,16 @@
+from bisect import bisect_left
+from itertools import accumulate
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin, Group
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Count, Prefetch
+from django.urls import reverse
 from django.utils.safestring import mark_safe
 
+from . import counters, images, shopping_list
+from .constants import COOKING_TIME_HISTOGRAM_CACHE_KEY
 from .models import (
     Favorite,
     Ingredient,
@@ -29,9 +38,14 @@ class TagAdmin(admin.ModelAdmin):
     search_fields = ('name', 'slug')
     readonly_fields = ('recipe_count',)
 
-    @admin.display(description='Рецептов')
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipe_count=Count('recipes', distinct=True)
+        )
+
+    @admin.display(description='Рецептов', ordering='recipe_count')
     def recipe_count(self, tag):
-        return tag.recipes.count()
+        return tag.recipe_count
 
 
 class HasRelatedFilter(admin.SimpleListFilter):
@@ -71,56 +85,115 @@ class IngredientAdmin(admin.ModelAdmin):
     list_filter = ('unit', HasRecipesFilter)
     readonly_fields = ('recipe_count',)
 
-    @admin.display(description='Рецептов')
+    def get_search_fields(self, request):
+        # Автодополнение в рецепте ищет по началу названия: такой запрос
+        # обслуживает индекс ingredient_name_upper_idx.
+        if request.path == reverse('admin:autocomplete'):
+            return ('^name',)
+        return super().get_search_fields(request)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipe_count=Count('ingredient_amounts', distinct=True)
+        )
+
+    @admin.display(description='Рецептов', ordering='recipe_count')
     def recipe_count(self, ingredient):
-        return ingredient.ingredient_amounts.count()
+        return ingredient.recipe_count
 
 
 class CookingTimeFilter(admin.SimpleListFilter):
     title = 'Время готовки'
     parameter_name = 'cook_time'
+    # 'equal' — три диапазона равной ширины,
+    # 'quantile' — три диапазона с примерно равным числом рецептов.
+    buckets = 'equal'
+    cache_timeout = 60
+    ranges = {}
+    labels = {
+        'quick': 'до {high} мин',
+        'medium': '{low}–{high} мин',
+        'long': 'от {low} мин',
+    }
+
+    @classmethod
+    def get_histogram(cls):
+        """Пары (время готовки, число рецептов) одним запросом."""
+        histogram = cache.get(COOKING_TIME_HISTOGRAM_CACHE_KEY)
+        if histogram is None:
+            histogram = list(
+                Recipe.objects
+                .order_by('cooking_time')
+                .values('cooking_time')
+                .annotate(count=Count('id'))
+                .values_list('cooking_time', 'count')
+            )
+            cache.set(
+                COOKING_TIME_HISTOGRAM_CACHE_KEY, histogram,
+                cls.cache_timeout
+            )
+        return histogram
+
+    def _get_limits(self, histogram):
+        min_time = histogram[0][0]
+        max_time = histogram[-1][0]
+        if self.buckets == 'quantile':
+            cumulative = list(accumulate(count for _, count in histogram))
+            total = cumulative[-1]
+            first_limit, second_limit = (
+                histogram[bisect_left(cumulative, total * part / 3)][0]
+                for part in (1, 2)
+            )
+            return min_time, first_limit, second_limit, max_time
+        range_step = (max_time - min_time) // 3
+        return (
+            min_time,
+            min_time + range_step,
+            min_time + 2 * range_step,
+            max_time,
+        )
 
-    def lookups(self, request, model_admin):
-        self.recipes = model_admin.get_queryset(request)
+    def _get_ranges(self, histogram):
+        """Диапазоны {ключ: (от, до)} без пустых.
+
+        При большом числе одинаковых значений границы совпадают, и
+        средний или длинный диапазон оказывается пустым: такой
+        диапазон пропускается.
+        """
+        min_time, *limits = self._get_limits(histogram)
+        ranges = {}
+        low = min_time
+        for key, high in zip(('quick', 'medium', 'long'), limits):
+            if low <= high:
+                ranges[key] = (low, high)
+                low = high + 1
+        return ranges
 
-        cooking_times = self.recipes.values_list(
-            'cooking_time', flat=True
-        ).distinct()
+    def lookups(self, request, model_admin):
+        histogram = self.get_histogram()
 
-        if len(cooking_times) < 3:
+        if len(histogram) < 3:
             return []
 
-        min_time = min(cooking_times)
-        max_time = max(cooking_times)
-        range_step = (max_time - min_time) // 3
-
-        first_limit = min_time + range_step
-        second_limit = min_time + 2 * range_step
-
-        self.ranges = {
-            'quick': (min_time, first_limit),
-            'medium': (first_limit + 1, second_limit),
-            'long': (second_limit + 1, max_time),
+        self.ranges = self._get_ranges(histogram)
+        if len(self.ranges) < 2:
+            return []
+        counts = {
+            key: sum(
+                count for time, count in histogram if low <= time <= high
+            )
+            for key, (low, high) in self.ranges.items()
         }
-
-        return (
-            ('quick', f'до {first_limit} мин'
-                      f' ({self._get_recipes("quick").count()})'),
-            ('medium', f'{first_limit + 1}–{second_limit} мин'
-                       f' ({self._get_recipes("medium").count()})'),
-            ('long', f'от {second_limit + 1} мин'
-                     f' ({self._get_recipes("long").count()})'),
-        )
-
-    def _get_recipes(self, key, recipes=None):
-        if recipes is None:
-            recipes = self.recipes
-        return recipes.filter(cooking_time__range=self.ranges[key])
+        return [
+            (key, f'{self.labels[key].format(low=low, high=high)} '
+                  f'({counts[key]})')
+            for key, (low, high) in self.ranges.items()
+        ]
 
     def queryset(self, request, recipes):
         value = self.value()
         if value in self.ranges:
-            return self._get_recipes(value, recipes)
+            return recipes.filter(cooking_time__range=self.ranges[value])
         return recipes
 
 
@@ -141,43 +214,159 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (RecipeIngredientInline,)
     readonly_fields = ('favorites_count', 'image_preview')
 
-    @admin.display(description='В избранном')
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredient_amounts',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
+    @admin.display(description='В избранном', ordering='favorites_count')
     def favorites_count(self, recipe):
-        return recipe.in_favorites.count()
+        return recipe.favorites_count
 
     @admin.display(description='Ингредиенты')
     def ingredient_list(self, recipe):
         return mark_safe('<br>'.join(
             f'{ri.ingredient.name} ({ri.amount}{ri.ingredient.unit})'
-            for ri in recipe.ingredient_amounts.select_related('ingredient')
+            for ri in recipe.ingredient_amounts.all()
         ))
 
     @admin.display(description='Теги')
     def tag_list(self, recipe):
         return mark_safe('<br>'.join(tag.name for tag in recipe.tags.all()))
 
+    def save_model(self, request, recipe, form, change):
+        if 'image' in form.changed_data:
+            recipe.images_ready = False
+        if change and 'author' in form.changed_data:
+            counters.increment(
+                User.objects.filter(pk=form.initial['author']),
+                'recipes_count', -1
+            )
+        super().save_model(request, recipe, form, change)
+        if not change or 'author' in form.changed_data:
+            counters.increment(
+                User.objects.filter(pk=recipe.author_id), 'recipes_count'
+            )
+        if 'image' in form.changed_data:
+            images.generate_derivatives.delay(recipe.image.name)
+
+    @staticmethod
+    def _amounts(recipe):
+        return dict(recipe.ingredient_amounts.values_list(
+            'ingredient_id', 'amount'
+        ))
+
+    def save_related(self, request, form, formsets, change):
+        """Переносит изменения состава из формы в списки покупок."""
+        if not change:
+            return super().save_related(request, form, formsets, change)
+        recipe = form.instance
+        old_amounts = self._amounts(recipe)
+        super().save_related(request, form, formsets, change)
+        shopping_list.change_recipe(
+            recipe.id, old_amounts, self._amounts(recipe)
+        )
+
     @admin.display(description='Изображение')
     def image_preview(self, recipe):
         if not recipe.image:
             return '-'
+        if not recipe.images_ready:
+            return mark_safe(
+                f'<img src="{recipe.image.url}" style="max-height:50px;" />'
+            )
+        urls = images.derivative_urls(recipe.image.name)['preview']
         return mark_safe(
-            f'<img src="{recipe.image.url}" style="max-height:50px;" />'
+            f'<picture><source srcset="{urls["webp"]}" type="image/webp">'
+            f'<img src="{urls["jpeg"]}" style="max-height:50px;" />'
+            '</picture>'
         )
 
 
+class UserRelationAdmin(admin.ModelAdmin):
+    """Связь пользователя с объектом related_field.
+
+    Добавленные, изменённые и удалённые в админке связи передаются
+    в relations_changed парами (user_id, id объекта), чтобы учесть их
+    так же, как это делает API.
+    """
+    related_field = None
+
+    def relations_changed(self, pairs, sign):
+        """Учитывает добавленные (sign=1) или удалённые (sign=-1) пары."""
+
+    def _pair(self, relation):
+        return relation.user_id, getattr(relation, f'{self.related_field}_id')
+
+    def save_model(self, request, relation, form, change):
+        if change and not {'user', self.related_field} & set(
+            form.changed_data
+        ):
+            return super().save_model(request, relation, form, change)
+        if change:
+            self.relations_changed(
+                [(form.initial['user'], form.initial[self.related_field])],
+                -1,
+            )
+        super().save_model(request, relation, form, change)
+        self.relations_changed([self._pair(relation)], 1)
+
+    def delete_model(self, request, relation):
+        pair = self._pair(relation)
+        super().delete_model(request, relation)
+        self.relations_changed([pair], -1)
+
+    def delete_queryset(self, request, queryset):
+        pairs = list(queryset.values_list(
+            'user_id', f'{self.related_field}_id'
+        ))
+        super().delete_queryset(request, queryset)
+        self.relations_changed(pairs, -1)
+
+
 @admin.register(Favorite, ShoppingCart)
-class RecipeRelationAdmin(admin.ModelAdmin):
+class RecipeRelationAdmin(UserRelationAdmin):
+    related_field = 'recipe'
     list_display = ('id', 'user', 'recipe')
+    list_select_related = ('user', 'recipe')
     search_fields = ('user__username', 'user__email', 'recipe__name')
 
+    def relations_changed(self, pairs, sign):
+        counters.apply(
+            Recipe, self.model.counter_field,
+            (recipe_id for _, recipe_id in pairs), sign,
+        )
+        if self.model is ShoppingCart:
+            shopping_list.change_carts(pairs, sign)
+
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(UserRelationAdmin):
+    related_field = 'author'
     list_display = ('id', 'user', 'author')
+    list_select_related = ('user', 'author')
     search_fields = (
         'user__username', 'user__email', 'author__username', 'author__email'
     )
 
+    def relations_changed(self, pairs, sign):
+        counters.apply(
+            User, 'subscriptions_count', (user_id for user_id, _ in pairs),
+            sign,
+        )
+        counters.apply(
+            User, 'followers_count', (author_id for _, author_id in pairs),
+            sign,
+        )
+
 
 class RecipeInline(admin.TabularInline):
     model = Recipe
@@ -186,6 +375,11 @@ class RecipeInline(admin.TabularInline):
     can_delete = False
     show_change_link = True
 
+    def has_add_permission(self, request, obj=None):
+        # Рецепты создаются на своей странице: там ведутся счётчики
+        # и состав.
+        return False
+
 
 class HasSubscriptionsFilter(HasRelatedFilter):
     title = 'Есть подписки'
@@ -237,18 +431,21 @@ class UserAdmin(DjangoUserAdmin):
     def avatar_preview(self, user):
         if not user.avatar:
             return '-'
-        return mark_safe(
-            f'<img src="{user.avatar.url}" style="max-height:40px;" />'
+        preview = images.derivative_name(user.avatar.name, 'preview', 'jpeg')
+        url = (
+            default_storage.url(preview) if default_storage.exists(preview)
+            else user.avatar.url
         )
+        return mark_safe(f'<img src="{url}" style="max-height:40px;" />')
 
-    @admin.display(description='Рецептов')
+    @admin.display(description='Рецептов', ordering='recipes_count')
     def recipe_count(self, user):
-        return user.recipes.count()
+        return user.recipes_count
 
-    @admin.display(description='Подписок')
+    @admin.display(description='Подписок', ordering='subscriptions_count')
     def subscriptions_count(self, user):
-        return user.subscriptions.count()
+        return user.subscriptions_count
 
-    @admin.display(description='Подписчики')
+    @admin.display(description='Подписчики', ordering='followers_count')
     def followers_count(self, user):
-        return user.authors.count()
+        return user.followers_count
@@ -1,2 +1,6 @@
 MIN_COOKING_TIME = 1
 MIN_INGREDIENT_AMOUNT = 1
+MAX_BULK_IDS = 100
+MAX_PANTRY_INGREDIENTS = 100
+
+COOKING_TIME_HISTOGRAM_CACHE_KEY = 'admin:cooking_time_histogram'
@@ -0,0 +1,60 @@
+"""Денормализованные счётчики рецептов и пользователей."""
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from jobs.registry import task
+from .models import Favorite, Recipe, ShoppingCart, Subscription, User
+
+# (модель со счётчиком, поле счётчика, считаемая модель, поле связи)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+    (User, 'subscriptions_count', Subscription, 'user'),
+)
+
+
+def increment(queryset, field, delta=1):
+    """Атомарно меняет счётчик у строк queryset, не опускаясь ниже нуля."""
+    return queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def apply(model, field, ids, delta=1):
+    """Меняет счётчик на delta за каждое вхождение id в ids.
+
+    Строки с одинаковым итоговым изменением обновляются одним запросом.
+    """
+    by_delta = defaultdict(list)
+    for pk, count in Counter(ids).items():
+        by_delta[count * delta].append(pk)
+    for change, pks in by_delta.items():
+        increment(model.objects.filter(pk__in=pks), field, change)
+
+
+def count_subquery(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects
+            .filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+@task
+def reconcile():
+    """Пересчитывает разошедшиеся счётчики; возвращает {поле: строк}."""
+    fixed = {}
+    for model, counter, counted_model, field in COUNTERS:
+        actual = count_subquery(counted_model, field)
+        fixed[f'{model.__name__}.{counter}'] = model.objects.exclude(
+            **{counter: actual}
+        ).update(**{counter: actual})
+    return fixed
@@ -0,0 +1,292 @@
+"""Поиск рецептов по имеющимся ингредиентам: «что можно приготовить».
+
+Обратный индекс в памяти процесса. Рецептам с ингредиентами присвоены
+позиции 0..n-1, и для каждого ингредиента хранится множество позиций
+рецептов, где он нужен: у частых — битовой картой в int, у редких —
+отсортированным массивом, который занимает меньше памяти. Ещё по одной
+битовой карте на каждое число ингредиентов в рецепте.
+
+Карты ингредиентов пользователя складываются поразрядно (bit-sliced
+counter): число совпадений каждого рецепта хранится в двоичном виде, по
+разряду на int. Группа «в рецепте k ингредиентов, есть m» выделяется
+несколькими AND, поэтому весь каталог оценивается операциями над
+n-битными числами без цикла по рецептам.
+
+Изменённые рецепты дочитываются по Recipe.updated_at не чаще раза в
+REFRESH_INTERVAL секунд, удалённые выбывают, как только попадутся в
+выдаче. Целиком индекс перестраивается раз в COVERAGE_INDEX_TTL секунд.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import Recipe, RecipeIngredient
+
+# Массив позиций занимает 4 байта на рецепт, битовая карта — n / 8 байт.
+DENSE_RATIO = 32
+REFRESH_INTERVAL = 1
+# Запас на транзакции, зафиксированные позже значения их updated_at.
+SYNC_OVERLAP = timedelta(minutes=1)
+BUILD_CHUNK_SIZE = 10000
+
+
+def _to_bitmap(positions):
+    if isinstance(positions, int):
+        return positions
+    if not positions:
+        return 0
+    data = bytearray(positions[-1] // 8 + 1)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, 'little')
+
+
+def _contains(positions, position):
+    if isinstance(positions, int):
+        return positions >> position & 1
+    index = bisect_left(positions, position)
+    return index < len(positions) and positions[index] == position
+
+
+def _with(positions, position):
+    if isinstance(positions, int):
+        return positions | 1 << position
+    positions = array('I', positions)
+    positions.insert(bisect_left(positions, position), position)
+    return positions
+
+
+def _without(positions, position):
+    if isinstance(positions, int):
+        return positions & ~(1 << position)
+    positions = array('I', positions)
+    del positions[bisect_left(positions, position)]
+    return positions
+
+
+class CoverageResults:
+    """Выдача, упорядоченная по доле имеющихся ингредиентов.
+
+    Ведёт себя как последовательность троек (recipe_id, есть, нужно)
+    для Paginator: длина известна сразу, а страница извлекается из
+    битовых карт групп только при обращении по срезу.
+    """
+
+    def __init__(self, groups, recipe_ids):
+        self._groups = groups
+        self._recipe_ids = recipe_ids
+        self._count = sum(count for _, count, _, _ in groups)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            raise TypeError('Поддерживаются только срезы.')
+        start, stop, _ = item.indices(self._count)
+        skip, wanted = start, max(stop - start, 0)
+        found = []
+        for bitmap, count, matched, needed in self._groups:
+            if not wanted:
+                break
+            if skip >= count:
+                skip -= count
+                continue
+            # Внутри группы новые рецепты (старшие позиции) идут первыми.
+            while bitmap and wanted:
+                position = bitmap.bit_length() - 1
+                bitmap ^= 1 << position
+                if skip:
+                    skip -= 1
+                    continue
+                found.append((self._recipe_ids[position], matched, needed))
+                wanted -= 1
+        return found
+
+
+class CoverageIndex:
+    """Индекс «ингредиент → рецепты» для поиска по имеющимся продуктам."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._built_at = 0
+        self._checked_at = 0
+        self._synced_at = None
+        # Какие версии недавно изменённых рецептов уже учтены.
+        self._applied = {}
+
+    def _is_stale(self):
+        return (
+            self._state is None
+            or time.monotonic() - self._built_at
+            > settings.COVERAGE_INDEX_TTL
+        )
+
+    def _build(self):
+        synced_at = Recipe.objects.aggregate(Max('updated_at'))[
+            'updated_at__max'
+        ]
+        recipe_ids, positions = [], {}
+        postings = defaultdict(lambda: array('I'))
+        sizes = defaultdict(lambda: array('I'))
+        last_recipe, size = None, 0
+        rows = RecipeIngredient.objects.order_by('recipe_id').values_list(
+            'recipe_id', 'ingredient_id'
+        ).iterator(chunk_size=BUILD_CHUNK_SIZE)
+        for recipe_id, ingredient_id in rows:
+            if recipe_id != last_recipe:
+                if last_recipe is not None:
+                    sizes[size].append(positions[last_recipe])
+                positions[recipe_id] = len(recipe_ids)
+                recipe_ids.append(recipe_id)
+                last_recipe, size = recipe_id, 0
+            postings[ingredient_id].append(positions[recipe_id])
+            size += 1
+        if last_recipe is not None:
+            sizes[size].append(positions[last_recipe])
+        total = len(recipe_ids)
+        postings = {
+            ingredient_id: (
+                _to_bitmap(recipes) if len(recipes) * DENSE_RATIO > total
+                else recipes
+            )
+            for ingredient_id, recipes in postings.items()
+        }
+        sizes = {size: _to_bitmap(recipes) for size, recipes in sizes.items()}
+        self._state = (recipe_ids, positions, postings, sizes)
+        self._synced_at = synced_at
+        self._applied = {}
+        self._built_at = self._checked_at = time.monotonic()
+
+    def _apply(self, changes):
+        """Применяет новые составы {recipe_id: set(ingredient_id)}."""
+        recipe_ids, positions, postings, sizes = self._state
+        postings, sizes = dict(postings), dict(sizes)
+        for recipe_id, ingredient_ids in changes.items():
+            position = positions.get(recipe_id)
+            if position is None:
+                if not ingredient_ids:
+                    continue
+                position = positions[recipe_id] = len(recipe_ids)
+                recipe_ids.append(recipe_id)
+            for ingredient_id, recipes in list(postings.items()):
+                if (
+                    ingredient_id not in ingredient_ids
+                    and _contains(recipes, position)
+                ):
+                    postings[ingredient_id] = _without(recipes, position)
+            for ingredient_id in ingredient_ids:
+                recipes = postings.get(ingredient_id, array('I'))
+                if not _contains(recipes, position):
+                    postings[ingredient_id] = _with(recipes, position)
+            for size, recipes in list(sizes.items()):
+                if _contains(recipes, position):
+                    sizes[size] = _without(recipes, position)
+            if ingredient_ids:
+                size = len(ingredient_ids)
+                sizes[size] = _with(sizes.get(size, 0), position)
+        self._state = (recipe_ids, positions, postings, sizes)
+
+    def _refresh(self):
+        """Дочитывает рецепты, изменённые после прошлой сверки."""
+        since = self._synced_at or Recipe.objects.aggregate(
+            Max('updated_at')
+        )['updated_at__max']
+        if since is None:
+            return
+        changed = {
+            recipe_id: updated_at
+            for recipe_id, updated_at in Recipe.objects.filter(
+                updated_at__gte=since - SYNC_OVERLAP
+            ).values_list('pk', 'updated_at')
+            if self._applied.get(recipe_id) != updated_at
+        }
+        if changed:
+            # Новые рецепты получают позиции по возрастанию id, как при
+            # построении: старшая позиция означает более новый рецепт.
+            changes = {recipe_id: set() for recipe_id in sorted(changed)}
+            for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+                recipe_id__in=changed
+            ).values_list('recipe_id', 'ingredient_id'):
+                changes[recipe_id].add(ingredient_id)
+            self._apply(changes)
+            since = max(since, *changed.values())
+        self._synced_at = since
+        self._applied = {
+            recipe_id: updated_at
+            for recipe_id, updated_at in {**self._applied, **changed}.items()
+            if updated_at >= since - SYNC_OVERLAP
+        }
+
+    def _get_state(self):
+        if not self._is_stale() and (
+            time.monotonic() - self._checked_at < REFRESH_INTERVAL
+        ):
+            return self._state
+        with self._lock:
+            if self._is_stale():
+                self._build()
+            elif time.monotonic() - self._checked_at >= REFRESH_INTERVAL:
+                self._refresh()
+                self._checked_at = time.monotonic()
+            return self._state
+
+    def search(self, ingredient_ids, max_missing=None):
+        """Рецепты, где есть хотя бы один из ингредиентов пользователя.
+
+        Сначала идут рецепты с большей долей имеющихся ингредиентов,
+        при равной доле — с меньшим числом недостающих, затем с большим
+        числом совпавших; внутри группы — более новые.
+        """
+        recipe_ids, _, postings, sizes = self._get_state()
+        planes = []
+        for ingredient_id in set(ingredient_ids):
+            carry = _to_bitmap(postings.get(ingredient_id, 0))
+            for digit, plane in enumerate(planes):
+                if not carry:
+                    break
+                planes[digit], carry = plane ^ carry, plane & carry
+            if carry:
+                planes.append(carry)
+        full = (1 << len(recipe_ids)) - 1
+        groups = []
+        for matched in range(1, 1 << len(planes)):
+            equal = full
+            for digit, plane in enumerate(planes):
+                equal &= plane if matched >> digit & 1 else plane ^ full
+            if not equal:
+                continue
+            for needed, recipes in sizes.items():
+                if needed < matched:
+                    continue
+                if max_missing is not None and needed - matched > max_missing:
+                    continue
+                bitmap = recipes & equal
+                if bitmap:
+                    groups.append(
+                        (bitmap, bitmap.bit_count(), matched, needed)
+                    )
+        groups.sort(key=lambda group: (
+            -group[2] / group[3], group[3] - group[2], -group[2]
+        ))
+        return CoverageResults(groups, recipe_ids)
+
+    def forget(self, recipe_ids):
+        """Убирает удалённые рецепты из индекса."""
+        with self._lock:
+            if self._state is not None:
+                self._apply({recipe_id: set() for recipe_id in recipe_ids})
+
+    def invalidate(self):
+        """Просит сверить индекс с базой при следующем поиске."""
+        self._checked_at = 0
+
+
+coverage_index = CoverageIndex()
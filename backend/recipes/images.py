@@ -0,0 +1,83 @@
+"""Уменьшенные копии изображений рецептов в WebP и JPEG.
+
+Копии строятся фоновой задачей после сохранения рецепта и лежат
+рядом с оригиналом в каталоге derivatives/ под предсказуемыми именами,
+поэтому их адреса вычисляются без обращения к хранилищу. Построив все
+копии, задача отмечает рецепт флагом images_ready; до этого API не
+отдаёт адреса копий.
+"""
+import io
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from jobs.registry import task
+from .models import Recipe
+
+SIZES = {
+    'preview': (100, 100),
+    'card': (480, 480),
+    'detail': (1200, 1200),
+}
+FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+QUALITY = 80
+
+
+def derivative_name(name, size, extension):
+    path = PurePosixPath(name)
+    return str(path.parent / 'derivatives' / f'{path.stem}_{size}.{extension}')
+
+
+def derivative_urls(name):
+    """Адреса копий: {размер: {формат: url}}."""
+    return {
+        size: {
+            extension: default_storage.url(
+                derivative_name(name, size, extension)
+            )
+            for extension in FORMATS
+        }
+        for size in SIZES
+    }
+
+
+def _flatten(image):
+    """Накладывает изображение с прозрачностью на белый фон для JPEG."""
+    if image.mode != 'RGBA':
+        return image
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+@task
+def generate_derivatives(name, sizes=None):
+    """Строит копии указанных размеров (по умолчанию всех)."""
+    with default_storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        has_alpha = (
+            'A' in image.getbands() or 'transparency' in image.info
+        )
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    for size in sizes or SIZES:
+        resized = image.copy()
+        resized.thumbnail(SIZES[size], Image.LANCZOS)
+        for extension, image_format in FORMATS.items():
+            output = resized if image_format == 'WEBP' else _flatten(resized)
+            buffer = io.BytesIO()
+            output.save(buffer, image_format, quality=QUALITY)
+            target = derivative_name(name, size, extension)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+    if sizes is None:
+        # save(), а не update(): сигналы сбросят кэш ответов с рецептом,
+        # а дата изменения обновится для ETag.
+        for recipe in Recipe.objects.filter(image=name, images_ready=False):
+            recipe.images_ready = True
+            recipe.save(update_fields=('images_ready', 'updated_at'))
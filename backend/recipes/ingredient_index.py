@@ -0,0 +1,72 @@
+"""Индекс названий ингредиентов в памяти процесса для автодополнения."""
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from . import versions
+from .models import Ingredient
+
+
+class IngredientIndex:
+    """Отсортированный список названий в нижнем регистре.
+
+    Поиск по префиксу — два бинарных поиска по списку. Точное совпадение
+    сортируется раньше любого более длинного названия с тем же префиксом,
+    поэтому оказывается первым в выдаче без отдельного ранжирования.
+    Перед поиском индекс сверяет версию ингредиентов в базе (одно
+    чтение по первичному ключу) и перестраивается, если она сменилась:
+    так о переимпорте и правках в админке узнают все процессы. Кроме
+    того, индекс перестраивается не реже раза в INGREDIENT_INDEX_TTL
+    секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._built_at = 0
+
+    def _is_stale(self, version):
+        return (
+            self._index is None
+            or version != self._version
+            or time.monotonic() - self._built_at
+            > settings.INGREDIENT_INDEX_TTL
+        )
+
+    def _get_index(self):
+        version = versions.get_version(versions.INGREDIENTS)
+        index = self._index
+        if not self._is_stale(version):
+            return index
+        with self._lock:
+            if not self._is_stale(version):
+                return self._index
+            ingredients = sorted(
+                Ingredient.objects.all(),
+                key=lambda ingredient: (ingredient.name.lower(),
+                                        ingredient.unit)
+            )
+            keys = [ingredient.name.lower() for ingredient in ingredients]
+            self._index = index = (keys, ingredients)
+            self._version = version
+            self._built_at = time.monotonic()
+        return index
+
+    def search(self, prefix: str, limit: int | None = None):
+        keys, ingredients = self._get_index()
+        prefix = prefix.strip().lower()
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + chr(0x10FFFF), lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return ingredients[start:end]
+
+    def invalidate(self):
+        self._index = None
+        versions.bump(versions.INGREDIENTS)
+
+
+ingredient_index = IngredientIndex()
@@ -1,27 +1,218 @@
+import csv
+import io
 import json
+from itertools import islice
 from pathlib import Path
-from typing import Type
+from typing import Iterator, Type
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
 from django.db.models import Model
 
+READ_SIZE = 64 * 1024
+
+
+def iter_json_array(file) -> Iterator[dict]:
+    """Читает элементы JSON-массива по одному, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(READ_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise ValueError('Ожидался JSON-массив.')
+                started = True
+                position += 1
+                continue
+            if position >= len(buffer):
+                break
+            if buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise
+                break
+            yield item
+            position = end
+        if not chunk:
+            raise ValueError('Неожиданный конец JSON-массива.')
+
 
 class BaseImportCommand(BaseCommand):
+    """Потоковый импорт справочника из CSV или JSON пачками с upsert.
+
+    Подклассы задают модель, путь к данным, поля уникального ключа
+    (unique_fields), обновляемые поля (update_fields) и соответствие
+    колонок файла полям модели (field_map).
+    """
     model: Type[Model]
     data_path: Path
+    unique_fields: tuple[str, ...]
+    update_fields: tuple[str, ...] = ()
+    field_map: dict[str, str] = {}
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', type=Path, default=None,
+            help='Файл с данными (.csv или .json).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк записывать за раз.'
+        )
+
+    @property
+    def fields(self):
+        return (*self.unique_fields, *self.update_fields)
 
-    def handle(self, *args, **kwargs):
+    def read_rows(self, path: Path) -> Iterator[dict]:
+        with path.open(encoding='utf-8', newline='') as file:
+            rows = (
+                csv.DictReader(file) if path.suffix == '.csv'
+                else iter_json_array(file)
+            )
+            for row in rows:
+                yield {
+                    self.field_map.get(key, key): value
+                    for key, value in row.items()
+                }
+
+    def clean_rows(self, rows):
+        """Отбрасывает неполные строки и повторы ключа внутри пачки."""
+        seen = set()
+        for row in rows:
+            values = tuple(row.get(field) for field in self.fields)
+            if any(value in (None, '') for value in values):
+                continue
+            key = values[:len(self.unique_fields)]
+            if key in seen:
+                continue
+            seen.add(key)
+            yield dict(zip(self.fields, values))
+
+    def write_batch_orm(self, rows):
+        """Upsert пачки через ORM; возвращает (добавлено, обновлено)."""
+        model = self.model
+        existing = {
+            tuple(values[:len(self.unique_fields)]): values
+            for values in model.objects.filter(**{
+                f'{self.unique_fields[0]}__in': {
+                    row[self.unique_fields[0]] for row in rows
+                }
+            }).values_list(*self.fields)
+        }
+        new, changed = [], []
+        for row in rows:
+            values = tuple(row[field] for field in self.fields)
+            old = existing.get(values[:len(self.unique_fields)])
+            if old is None:
+                new.append(model(**row))
+            elif old != values:
+                changed.append(model(**row))
+        if changed:
+            model.objects.bulk_create(
+                changed,
+                update_conflicts=True,
+                unique_fields=self.unique_fields,
+                update_fields=self.update_fields,
+            )
+        model.objects.bulk_create(new, ignore_conflicts=True)
+        return len(new), len(changed)
+
+    def write_batch_copy(self, rows):
+        """Upsert пачки через COPY во временную таблицу (PostgreSQL)."""
+        table = self.model._meta.db_table
+        columns = [
+            self.model._meta.get_field(field).column for field in self.fields
+        ]
+        unique = [
+            self.model._meta.get_field(field).column
+            for field in self.unique_fields
+        ]
+        quote = connection.ops.quote_name
+        column_list = ', '.join(map(quote, columns))
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            [row[field] for field in self.fields] for row in rows
+        )
+        buffer.seek(0)
+        updates = [
+            quote(self.model._meta.get_field(field).column)
+            for field in self.update_fields
+        ]
+        on_conflict = (
+            'DO UPDATE SET '
+            + ', '.join(f'{column} = EXCLUDED.{column}' for column in updates)
+            + ' WHERE ('
+            + ', '.join(f'{quote(table)}.{column}' for column in updates)
+            + ') IS DISTINCT FROM ('
+            + ', '.join(f'EXCLUDED.{column}' for column in updates)
+            + ')'
+            if updates else 'DO NOTHING'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE import_rows ON COMMIT DROP AS '
+                f'SELECT {column_list} FROM {quote(table)} WITH NO DATA'
+            )
+            cursor.copy_expert(
+                f'COPY import_rows ({column_list}) FROM STDIN WITH CSV',
+                buffer,
+            )
+            cursor.execute(
+                f'INSERT INTO {quote(table)} ({column_list}) '
+                f'SELECT {column_list} FROM import_rows '
+                f'ON CONFLICT ({", ".join(map(quote, unique))}) '
+                f'{on_conflict} RETURNING xmax = 0'
+            )
+            results = [inserted for inserted, in cursor.fetchall()]
+        created = sum(results)
+        return created, len(results) - created
+
+    def handle(self, *args, path=None, batch_size=1000, **options):
+        path = path or self.data_path
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+        write_batch = (
+            self.write_batch_copy if connection.vendor == 'postgresql'
+            else self.write_batch_orm
+        )
+        created = updated = skipped = 0
+        rows = self.read_rows(path)
         try:
-            rows = json.loads(self.data_path.read_text(encoding='utf-8'))
-            to_create = [self.model(**row) for row in rows]
-            created = self.model.objects.bulk_create(
-                to_create, ignore_conflicts=True)
-            self.stdout.write(self.style.SUCCESS(
-                f'Импорт из {self.data_path.name} завершён: '
-                f'добавлено {len(created)} '
-                f'{self.model._meta.verbose_name_plural}'
-            ))
-        except Exception as exc:
-            self.stderr.write(self.style.ERROR(
-                f'Ошибка при импорте из {self.data_path.name}: {exc}'
-            ))
+            while batch := list(islice(rows, batch_size)):
+                clean = list(self.clean_rows(batch))
+                with transaction.atomic():
+                    batch_created, batch_updated = write_batch(clean)
+                created += batch_created
+                updated += batch_updated
+                skipped += len(batch) - batch_created - batch_updated
+                if options['verbosity'] > 1:
+                    self.stdout.write(
+                        f'Обработано строк: {created + updated + skipped}'
+                    )
+        except (DatabaseError, ValueError) as exc:
+            raise CommandError(
+                f'Импорт из {path.name} прерван: {exc}. '
+                f'До ошибки добавлено {created}, обновлено {updated}, '
+                f'пропущено {skipped}.'
+            )
+        self.after_import()
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт из {path.name} завершён: '
+            f'добавлено {created}, обновлено {updated}, '
+            f'пропущено {skipped} '
+            f'({self.model._meta.verbose_name_plural.lower()}).'
+        ))
+
+    def after_import(self):
+        """Вызывается после успешного импорта."""
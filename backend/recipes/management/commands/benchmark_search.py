@@ -0,0 +1,44 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes.models import Recipe
+from recipes.search import search
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время поисковых запросов в том виде, в каком их '
+        'выполняет /api/recipes/?search=.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='+', help='Поисковые запросы.')
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз выполнить каждый запрос.'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=6,
+            help='Размер страницы выдачи.'
+        )
+
+    def handle(self, *args, queries, repeat=20, limit=6, **options):
+        self.stdout.write(
+            f'{connection.vendor}, рецептов: {Recipe.objects.count()}'
+        )
+        for query in queries:
+            recipes = search(Recipe.objects.all(), query)
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                found = list(recipes[:limit].values_list('pk', flat=True))
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f'{query!r}: найдено на странице {len(found)}, '
+                f'медиана {statistics.median(timings):.2f} мс, '
+                f'максимум {timings[-1]:.2f} мс'
+            )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_derivatives
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит уменьшенные копии изображений рецептов, у которых их '
+        'ещё нет.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить копии всех рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(images_ready=False)
+        done = failed = 0
+        for name in recipes.values_list(
+            'image', flat=True
+        ).distinct().iterator():
+            try:
+                generate_derivatives(name)
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(self.style.ERROR(f'{name}: {exc}'))
+            else:
+                done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {done}, с ошибками: {failed}.'
+        ))
@@ -1,5 +1,6 @@
 from pathlib import Path
 
+from recipes.ingredient_index import ingredient_index
 from recipes.models import Ingredient
 from ._base_import import BaseImportCommand
 
@@ -7,3 +8,8 @@ from ._base_import import BaseImportCommand
 class Command(BaseImportCommand):
     model = Ingredient
     data_path = Path('data/ingredients.json')
+    unique_fields = ('name', 'unit')
+    field_map = {'measurement_unit': 'unit'}
+
+    def after_import(self):
+        ingredient_index.invalidate()
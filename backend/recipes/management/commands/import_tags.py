@@ -1,5 +1,6 @@
 from pathlib import Path
 
+from recipes import versions
 from recipes.models import Tag
 from ._base_import import BaseImportCommand
 
@@ -7,3 +8,8 @@ from ._base_import import BaseImportCommand
 class Command(BaseImportCommand):
     model = Tag
     data_path = Path('data/tags.json')
+    unique_fields = ('slug',)
+    update_fields = ('name',)
+
+    def after_import(self):
+        versions.bump(versions.TAGS)
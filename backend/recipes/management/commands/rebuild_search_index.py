@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipes import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=search.BATCH_SIZE,
+            help='Сколько рецептов индексировать за одну транзакцию.'
+        )
+
+    def handle(self, *args, batch_size=search.BATCH_SIZE, **options):
+        total = search.rebuild(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковый индекс пересобран: {total} рецептов.'
+        ))
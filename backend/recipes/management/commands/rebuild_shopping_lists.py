@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from recipes import shopping_list
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет агрегированные списки покупок с корзинами '
+        'и пересобирает их с нуля.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только найти расхождения, не меняя данные.'
+        )
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='Ограничиться пользователем с этим id (можно повторять).'
+        )
+
+    def handle(self, *args, check=False, user_ids=None, **options):
+        if check:
+            stored = ShoppingListItem.objects.all()
+            if user_ids is not None:
+                stored = stored.filter(user_id__in=user_ids)
+            expected = {
+                (user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount
+                in shopping_list.expected_items(user_ids)
+            }
+            actual = {
+                (user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount
+                in stored.values_list('user_id', 'ingredient_id', 'amount')
+            }
+            broken = {
+                user_id for user_id, ingredient_id
+                in expected.keys() | actual.keys()
+                if expected.get((user_id, ingredient_id))
+                != actual.get((user_id, ingredient_id))
+            }
+            if broken:
+                self.stdout.write(self.style.WARNING(
+                    f'Расхождения у {len(broken)} пользователей: '
+                    f'{", ".join(map(str, sorted(broken)))}'
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+            return
+        created = shopping_list.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересобраны: {created} позиций.'
+        ))
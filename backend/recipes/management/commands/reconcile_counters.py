@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики, если они разошлись.'
+
+    def handle(self, *args, **options):
+        for counter, fixed in counters.reconcile().items():
+            self.stdout.write(f'{counter}: исправлено {fixed}')
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены.'))
@@ -0,0 +1,334 @@
+"""Синтетические данные для нагрузочных тестов и проверки планов.
+
+Число рецептов у авторов, популярность рецептов в избранном и корзинах,
+авторов в подписках и ингредиентов в рецептах распределены по
+степенному закону: немногие получают большую часть связей, как в живом
+каталоге. Одинаковый --seed даёт одинаковые данные: даты отсчитываются
+от фиксированного момента, а не от дня запуска.
+
+Строки пишутся пачками: в PostgreSQL через COPY, в остальных СУБД —
+executemany. bulk_create не подходит: auto_now_add заменил бы
+разнесённые по времени даты публикации текущей.
+"""
+import csv
+import io
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate, islice
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from recipes import counters, search, shopping_list, versions
+from recipes.images import generate_derivatives
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Subscription,
+    Tag,
+    User,
+)
+
+INGREDIENTS_PATH = Path('data/ingredients.csv')
+IMAGE_NAME = 'recipes/images/benchmark.png'
+END = datetime(2025, 1, 1)
+TAG_COUNT = 8
+AMOUNTS = (1, 2, 3, 5, 10, 50, 100, 150, 200, 250, 500, 1000)
+FIRST_NAMES = (
+    'Анна', 'Иван', 'Мария', 'Пётр', 'Елена', 'Олег', 'Ольга', 'Сергей',
+)
+LAST_NAMES = (
+    'Иванова', 'Петров', 'Смирнова', 'Кузнецов', 'Попова', 'Соколов',
+)
+
+
+def power_law_weights(count, alpha):
+    """Накопленные веса 1 / rank^alpha для random.choices."""
+    return list(accumulate(
+        1 / rank ** alpha for rank in range(1, count + 1)
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, рецептами, '
+        'избранным, корзинами и подписками для нагрузочных тестов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--min-ingredients', type=int, default=3,
+            help='Наименьшее число ингредиентов в рецепте.'
+        )
+        parser.add_argument(
+            '--max-ingredients', type=int, default=12,
+            help='Наибольшее число ингредиентов в рецепте.'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число рецептов в избранном у пользователя.'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Среднее число рецептов в корзине у пользователя.'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Среднее число подписок у пользователя.'
+        )
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='Показатель степенного распределения популярности.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Сколько строк записывать за раз.'
+        )
+
+    def _write(self, model, fields, rows):
+        """Пишет кортежи значений fields пачками; возвращает число строк."""
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        columns = ', '.join(
+            quote(model._meta.get_field(field).column) for field in fields
+        )
+        total = 0
+        while batch := list(islice(rows, self.batch_size)):
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(batch)
+                    buffer.seek(0)
+                    cursor.copy_expert(
+                        f'COPY {table} ({columns}) FROM STDIN WITH CSV',
+                        buffer,
+                    )
+                else:
+                    placeholders = ', '.join(['%s'] * len(fields))
+                    cursor.executemany(
+                        f'INSERT INTO {table} ({columns}) '
+                        f'VALUES ({placeholders})',
+                        batch,
+                    )
+            total += len(batch)
+            if self.verbosity > 1:
+                self.stdout.write(f'{model._meta.db_table}: {total}')
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {total}')
+        return total
+
+    def _date(self, offset):
+        date = END - timedelta(seconds=offset)
+        if settings.USE_TZ:
+            date = timezone.make_aware(date, timezone.utc)
+        return connection.ops.adapt_datetimefield_value(date)
+
+    def _sample(self, population, cum_weights, count, exclude=None):
+        """До count разных элементов, выбранных по весам."""
+        chosen = dict.fromkeys(self.random.choices(
+            population, cum_weights=cum_weights, k=count
+        ))
+        chosen.pop(exclude, None)
+        return chosen
+
+    def _get_ingredient_ids(self):
+        call_command('import_ingredients', path=INGREDIENTS_PATH,
+                     stdout=io.StringIO())
+        with INGREDIENTS_PATH.open(encoding='utf-8', newline='') as file:
+            names = {row['name'] for row in csv.DictReader(file)}
+        ingredient_ids = list(Ingredient.objects.filter(
+            name__in=names
+        ).order_by('pk').values_list('pk', flat=True))
+        # Частые ингредиенты выбираются случайно, но одинаково для seed.
+        self.random.shuffle(ingredient_ids)
+        return ingredient_ids
+
+    def _get_tag_ids(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=f'Тег {number}', slug=f'tag-{number}')
+                for number in range(1, TAG_COUNT + 1)
+            )
+        return list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+
+    def _ensure_image(self):
+        if default_storage.exists(IMAGE_NAME):
+            return
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 400), (230, 150, 80)).save(buffer, 'PNG')
+        default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+        generate_derivatives(IMAGE_NAME)
+
+    def _users(self, user_ids, prefix):
+        password = make_password(None)
+        for number, user_id in enumerate(user_ids):
+            username = f'{prefix}_{number}'
+            yield (
+                user_id, password, False, False, True,
+                self._date(number * 60), f'{username}@example.com',
+                username, self.random.choice(FIRST_NAMES),
+                self.random.choice(LAST_NAMES), 0, 0, 0,
+            )
+
+    def _compositions(self, recipe_ids, ingredient_ids):
+        """Составы рецептов; при повторном вызове — те же самые.
+
+        Составы нужны дважды: для названий рецептов и для их
+        ингредиентов. Отдельный генератор случайных чисел позволяет
+        не держать их в памяти между проходами.
+        """
+        generator = random.Random(f'{self.seed}:compositions')
+        weights = power_law_weights(len(ingredient_ids), self.alpha)
+        for recipe_id in recipe_ids:
+            count = generator.randint(
+                self.min_ingredients, self.max_ingredients
+            )
+            yield recipe_id, list(dict.fromkeys(generator.choices(
+                ingredient_ids, cum_weights=weights, k=count
+            )))
+
+    def _recipes(self, recipe_ids, authors, ingredient_ids):
+        names = dict(Ingredient.objects.filter(
+            pk__in=ingredient_ids
+        ).values_list('pk', 'name'))
+        span = 365 * 24 * 3600
+        compositions = self._compositions(recipe_ids, ingredient_ids)
+        for number, ((recipe_id, ingredients), author_id) in enumerate(
+            zip(compositions, authors)
+        ):
+            first, *rest = [names[pk] for pk in ingredients]
+            name = first.capitalize()
+            if rest:
+                name += f' и {rest[0]}'
+            date = self._date(span * (len(recipe_ids) - number)
+                              // len(recipe_ids))
+            yield (
+                recipe_id, author_id, name[:256], IMAGE_NAME, True,
+                f'Понадобится: {", ".join([first, *rest])}.',
+                self.random.randint(5, 180), date, date, 0, 0,
+            )
+
+    def handle(self, *args, users, recipes, min_ingredients,
+               max_ingredients, favorites, carts, subscriptions, alpha,
+               seed, batch_size, verbosity=1, **options):
+        if users < 1:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        if not 1 <= min_ingredients <= max_ingredients:
+            raise CommandError(
+                'Нужно 1 <= --min-ingredients <= --max-ingredients.'
+            )
+        prefix = f'bench{seed}'
+        if User.objects.filter(username=f'{prefix}_0').exists():
+            raise CommandError(
+                f'Данные с --seed {seed} уже созданы; выберите другой seed.'
+            )
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.alpha = alpha
+        self.batch_size = batch_size
+        self.verbosity = verbosity
+        self.min_ingredients = min_ingredients
+        self.max_ingredients = max_ingredients
+        self._ensure_image()
+        ingredient_ids = self._get_ingredient_ids()
+        tag_ids = self._get_tag_ids()
+
+        with transaction.atomic():
+            user_start = (User.objects.aggregate(Max('pk'))['pk__max']
+                          or 0) + 1
+            recipe_start = (Recipe.objects.aggregate(Max('pk'))['pk__max']
+                            or 0) + 1
+            user_ids = list(range(user_start, user_start + users))
+            recipe_ids = list(range(recipe_start, recipe_start + recipes))
+            self._write(User, (
+                'id', 'password', 'is_superuser', 'is_staff', 'is_active',
+                'date_joined', 'email', 'username', 'first_name',
+                'last_name', 'recipes_count', 'followers_count',
+                'subscriptions_count',
+            ), self._users(user_ids, prefix))
+
+            # Авторы и рецепты перемешаны, чтобы популярность не
+            # совпадала с порядком id.
+            popular_authors = self.random.sample(user_ids, len(user_ids))
+            author_weights = power_law_weights(users, alpha)
+            authors = self.random.choices(
+                popular_authors, cum_weights=author_weights, k=recipes
+            )
+            self._write(Recipe, (
+                'id', 'author', 'name', 'image', 'images_ready', 'text',
+                'cooking_time',
+                'pub_date', 'updated_at', 'favorites_count',
+                'shopping_carts_count',
+            ), self._recipes(recipe_ids, authors, ingredient_ids))
+            self._write(RecipeIngredient, (
+                'recipe', 'ingredient', 'amount'
+            ), (
+                (recipe_id, ingredient_id, self.random.choice(AMOUNTS))
+                for recipe_id, ingredients in self._compositions(
+                    recipe_ids, ingredient_ids
+                )
+                for ingredient_id in ingredients
+            ))
+            tag_weights = power_law_weights(len(tag_ids), alpha)
+            self._write(Recipe.tags.through, ('recipe', 'tag'), (
+                (recipe_id, tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in self._sample(
+                    tag_ids, tag_weights, self.random.randint(1, 3)
+                )
+            ))
+
+            if recipes:
+                popular_recipes = self.random.sample(recipe_ids, recipes)
+                recipe_weights = power_law_weights(recipes, alpha)
+                for model, average in (
+                    (Favorite, favorites), (ShoppingCart, carts)
+                ):
+                    self._write(model, ('user', 'recipe'), (
+                        (user_id, recipe_id)
+                        for user_id in user_ids
+                        for recipe_id in self._sample(
+                            popular_recipes, recipe_weights,
+                            self.random.randint(0, 2 * average),
+                        )
+                    ))
+            self._write(Subscription, ('user', 'author'), (
+                (user_id, author_id)
+                for user_id in user_ids
+                for author_id in self._sample(
+                    popular_authors, author_weights,
+                    self.random.randint(0, 2 * subscriptions),
+                    exclude=user_id,
+                )
+            ))
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [User, Recipe]
+                ):
+                    cursor.execute(sql)
+
+        counters.reconcile()
+        shopping_list.rebuild()
+        search.rebuild()
+        versions.bump(versions.RECIPES, versions.TAGS, versions.INGREDIENTS)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные для seed {seed} созданы.'
+        ))
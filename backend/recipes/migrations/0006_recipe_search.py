@@ -0,0 +1,76 @@
+# Generated by Django 4.2.20 on 2026-10-17 13:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+from recipes.operations import AddPostgresIndex
+
+# Названия ингредиентов рецепта r одной строкой; {aggregate} у СУБД свой.
+INGREDIENT_NAMES = (
+    "SELECT {aggregate}(i.name, ' ') "
+    'FROM recipes_recipeingredient AS ri '
+    'JOIN recipes_ingredient AS i ON i.id = ri.ingredient_id '
+    'WHERE ri.recipe_id = r.id'
+)
+
+POSTGRES_FILL = (
+    'UPDATE recipes_recipe AS r SET search_vector = '
+    "setweight(to_tsvector('russian', translate(r.name, 'ёЁ', 'еЕ')), 'A') "
+    "|| setweight(to_tsvector('russian', translate(coalesce(("
+    + INGREDIENT_NAMES.format(aggregate='string_agg')
+    + "), ''), 'ёЁ', 'еЕ')), 'B') "
+    "|| setweight(to_tsvector('russian', translate(r.text, 'ёЁ', 'еЕ')), 'C')"
+)
+
+SQLITE_CREATE = (
+    'CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5('
+    "name, ingredients, text, tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+SQLITE_FILL = (
+    'INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text) '
+    "SELECT r.id, replace(replace(r.name, 'ё', 'е'), 'Ё', 'Е'), "
+    "replace(replace((" + INGREDIENT_NAMES.format(aggregate='group_concat')
+    + "), 'ё', 'е'), 'Ё', 'Е'), "
+    "replace(replace(r.text, 'ё', 'е'), 'Ё', 'Е') "
+    'FROM recipes_recipe AS r'
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_FILL)
+    elif vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+        schema_editor.execute(SQLITE_FILL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS recipes_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        AddPostgresIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=['search_vector'], name='recipe_search_vector_idx'
+            ),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-17 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='images_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Копии изображения готовы'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from django.db.models.functions import Upper
 
 from .constants import MIN_COOKING_TIME, MIN_INGREDIENT_AMOUNT
 
@@ -19,6 +22,15 @@ class User(AbstractUser):
     avatar = models.ImageField(
         'Аватар', upload_to='users/', blank=True, null=True
     )
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов', default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков', default=0, editable=False
+    )
+    subscriptions_count = models.PositiveIntegerField(
+        'Подписок', default=0, editable=False
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -59,11 +71,26 @@ class Ingredient(models.Model):
                 name='ingredient_unique_name_unit',
             ),
         )
+        indexes = (
+            # Поиск по началу названия без учёта регистра (istartswith),
+            # создаётся только в PostgreSQL.
+            models.Index(
+                OpClass(Upper('name'), name='text_pattern_ops'),
+                name='ingredient_name_upper_idx',
+            ),
+        )
 
     def __str__(self):
         return f'{self.name} ({self.unit})'
 
 
+class RecipeManager(models.Manager):
+    """Не загружает поисковый вектор: он нужен только в запросах."""
+
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User, on_delete=models.CASCADE,
@@ -71,6 +98,10 @@ class Recipe(models.Model):
     )
     name = models.CharField('Название', max_length=256)
     image = models.ImageField('Изображение', upload_to='recipes/images/')
+    # Уменьшенные копии image построены; сбрасывается при смене image.
+    images_ready = models.BooleanField(
+        'Копии изображения готовы', default=False, editable=False
+    )
     text = models.TextField('Описание')
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления (мин)',
@@ -91,11 +122,40 @@ class Recipe(models.Model):
         verbose_name='Теги'
     )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False
+    )
+    shopping_carts_count = models.PositiveIntegerField(
+        'В списках покупок', default=0, editable=False
+    )
+    # Заполняется recipes.search; используется только в PostgreSQL.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeManager()
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=('updated_at',),
+                name='recipe_updated_at_idx',
+            ),
+            GinIndex(
+                fields=('search_vector',),
+                name='recipe_search_vector_idx',
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -158,17 +218,51 @@ class UserRecipeBase(models.Model):
 
 
 class Favorite(UserRecipeBase):
+    counter_field = 'favorites_count'
+
     class Meta(UserRecipeBase.Meta):
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные'
 
 
 class ShoppingCart(UserRecipeBase):
+    counter_field = 'shopping_carts_count'
+
     class Meta(UserRecipeBase.Meta):
         verbose_name = 'Покупка'
         verbose_name_plural = 'Список покупок'
 
 
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в корзине пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='shopping_list_item_unique',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} — {self.amount}'
+
+
 class Subscription(models.Model):
     user = models.ForeignKey(
         User,
@@ -195,3 +289,16 @@ class Subscription(models.Model):
 
     def __str__(self):
         return f'{self.user} подписан на {self.author}'
+
+
+class DataVersion(models.Model):
+    """Момент последнего изменения набора данных (см. recipes.versions)."""
+    name = models.CharField('Набор данных', max_length=64, primary_key=True)
+    changed_at = models.BigIntegerField('Изменён, нс')
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return self.name
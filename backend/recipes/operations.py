@@ -0,0 +1,20 @@
+"""Операции миграций, которые выполняются только в PostgreSQL."""
+from django.db import migrations
+
+
+class AddPostgresIndex(migrations.AddIndex):
+    """Индекс, который нужен или создаётся только в PostgreSQL."""
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
@@ -0,0 +1,175 @@
+"""Полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+
+В PostgreSQL вектор хранится в столбце Recipe.search_vector с GIN-индексом
+и русской конфигурацией, в режиме SQLite — в виртуальной таблице FTS5.
+Индекс обновляется после фиксации транзакции, изменившей рецепт или его
+состав; пересобрать его целиком можно командой rebuild_search_index.
+"""
+import re
+import threading
+from itertools import islice
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection, transaction
+from django.db.models import (
+    F,
+    Func,
+    OuterRef,
+    Subquery,
+    TextField,
+    Value,
+)
+from django.db.models.expressions import RawSQL
+
+from jobs.registry import task
+from .models import Ingredient, Recipe, RecipeIngredient
+
+CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса столбцов FTS5 в порядке name, ingredients, text.
+FTS_WEIGHTS = '10.0, 5.0, 1.0'
+WORD_RE = re.compile(r'\w+')
+BATCH_SIZE = 5000
+
+_pending = threading.local()
+
+
+def normalize(text):
+    """Приводит «ё» к «е»: словари поиска не считают их одной буквой."""
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def _normalized(expression):
+    return Func(
+        expression, Value('ёЁ'), Value('еЕ'),
+        function='translate', output_field=TextField(),
+    )
+
+
+def _sqlite_normalized(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _postgres_vector():
+    ingredient_names = Subquery(
+        RecipeIngredient.objects
+        .filter(recipe=OuterRef('pk'))
+        .order_by()
+        .values('recipe')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names')
+    )
+    return (
+        SearchVector(_normalized('name'), weight='A', config=CONFIG)
+        + SearchVector(
+            _normalized(ingredient_names), weight='B', config=CONFIG
+        )
+        + SearchVector(_normalized('text'), weight='C', config=CONFIG)
+    )
+
+
+def _update_fts(recipe_ids):
+    if recipe_ids is None:
+        delete, where, params = f'DELETE FROM {FTS_TABLE}', '', []
+    else:
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        delete = f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})'
+        where = f'WHERE r.id IN ({placeholders})'
+        params = list(recipe_ids)
+    ingredient_names = (
+        "SELECT group_concat(i.name, ' ') "
+        f'FROM {RecipeIngredient._meta.db_table} AS ri '
+        f'JOIN {Ingredient._meta.db_table} AS i '
+        'ON i.id = ri.ingredient_id WHERE ri.recipe_id = r.id'
+    )
+    columns = ', '.join(map(_sqlite_normalized, (
+        'r.name', f'({ingredient_names})', 'r.text'
+    )))
+    with connection.cursor() as cursor:
+        cursor.execute(delete, params)
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+            f'SELECT r.id, {columns} '
+            f'FROM {Recipe._meta.db_table} AS r {where}',
+            params,
+        )
+
+
+def update_index(recipe_ids=None):
+    """Пересчитывает индекс указанных рецептов (None — всех)."""
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+    if connection.vendor == 'postgresql':
+        recipes = Recipe.objects.all()
+        if recipe_ids is not None:
+            recipes = recipes.filter(pk__in=recipe_ids)
+        recipes.update(search_vector=_postgres_vector())
+    elif connection.vendor == 'sqlite':
+        _update_fts(recipe_ids)
+
+
+def _flush():
+    recipe_ids = getattr(_pending, 'recipe_ids', set())
+    if not recipe_ids:
+        return
+    recipe_ids, _pending.recipe_ids = recipe_ids, set()
+    update_index(recipe_ids)
+
+
+def schedule_update(recipe_ids):
+    """Обновляет индекс рецептов после фиксации текущей транзакции."""
+    if not hasattr(_pending, 'recipe_ids'):
+        _pending.recipe_ids = set()
+    _pending.recipe_ids.update(recipe_ids)
+    transaction.on_commit(_flush)
+
+
+@task
+def rebuild(batch_size=BATCH_SIZE):
+    """Пересобирает индекс пачками; возвращает число рецептов."""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid NOT IN '
+                f'(SELECT id FROM {Recipe._meta.db_table})'
+            )
+    recipe_ids = Recipe.objects.order_by('pk').values_list(
+        'pk', flat=True
+    ).iterator(chunk_size=batch_size)
+    total = 0
+    while batch := list(islice(recipe_ids, batch_size)):
+        with transaction.atomic():
+            update_index(batch)
+        total += len(batch)
+    return total
+
+
+def search(queryset, text):
+    """Рецепты из queryset, подходящие под запрос, по релевантности."""
+    text = normalize(text)
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(text, config=CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', *Recipe._meta.ordering)
+    words = WORD_RE.findall(text)
+    if not words:
+        return queryset.none()
+    # Каждое слово ищется как префикс: FTS5 не умеет русскую морфологию.
+    match = ' '.join(f'"{word}"*' for word in words)
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (match,),
+    )).annotate(search_rank=RawSQL(
+        f'SELECT -bm25({FTS_TABLE}, {FTS_WEIGHTS}) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s '
+        f'AND rowid = {Recipe._meta.db_table}.id',
+        (match,),
+    )).order_by('-search_rank', *Recipe._meta.ordering)
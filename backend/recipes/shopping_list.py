@@ -0,0 +1,162 @@
+"""Поддержка агрегата ShoppingListItem в актуальном состоянии.
+
+Агрегат хранит для каждого пользователя сумму количеств ингредиентов
+всех рецептов в его корзине. Функции вызываются внутри транзакции,
+которая меняет корзину или состав рецепта, и применяют к агрегату
+разницу, не пересчитывая его целиком. Их вызывают все, кто меняет
+корзины и составы: API, админка и сигнал удаления рецепта.
+"""
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from jobs.registry import task
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+BATCH_SIZE = 1000
+
+
+def _recipe_amounts(recipe_ids):
+    """Составы рецептов: {recipe_id: {ingredient_id: amount}}."""
+    amounts = defaultdict(dict)
+    for recipe_id, ingredient_id, amount in RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient_id', 'amount'):
+        amounts[recipe_id][ingredient_id] = amount
+    return amounts
+
+
+def _insert_or_add(rows):
+    """Вставляет строки (user_id, ingredient_id, amount).
+
+    Параллельная транзакция могла создать ту же строку после нашего
+    select_for_update; тогда количество прибавляется к её значению,
+    а не нарушает уникальность.
+    """
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    meta = ShoppingListItem._meta
+    table = quote(meta.db_table)
+    user, ingredient, amount = (
+        quote(meta.get_field(field).column)
+        for field in ('user', 'ingredient', 'amount')
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} ({user}, {ingredient}, {amount}) '
+            f'VALUES (%s, %s, %s) '
+            f'ON CONFLICT ({user}, {ingredient}) '
+            f'DO UPDATE SET {amount} = {table}.{amount} + EXCLUDED.{amount}',
+            rows,
+        )
+
+
+@transaction.atomic
+def apply_changes(changes):
+    """Прибавляет к агрегату изменения {(user_id, ingredient_id): delta}."""
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if not changes:
+        return
+    user_ids = {user_id for user_id, _ in changes}
+    ingredient_ids = {ingredient_id for _, ingredient_id in changes}
+    to_update, to_delete = [], []
+    for item in ShoppingListItem.objects.select_for_update().filter(
+        user_id__in=user_ids, ingredient_id__in=ingredient_ids
+    ):
+        delta = changes.pop((item.user_id, item.ingredient_id), None)
+        if delta is None:
+            continue
+        item.amount += delta
+        if item.amount > 0:
+            to_update.append(item)
+        else:
+            to_delete.append(item.pk)
+    ShoppingListItem.objects.bulk_update(to_update, ('amount',))
+    ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+    _insert_or_add([
+        (user_id, ingredient_id, delta)
+        for (user_id, ingredient_id), delta in changes.items()
+        if delta > 0
+    ])
+
+
+def change_carts(carts, sign=1):
+    """Учитывает пары (user_id, recipe_id), добавленные в корзины
+    (sign=1) или убранные из них (sign=-1)."""
+    carts = list(carts)
+    amounts = _recipe_amounts({recipe_id for _, recipe_id in carts})
+    changes = Counter()
+    for user_id, recipe_id in carts:
+        for ingredient_id, amount in amounts[recipe_id].items():
+            changes[user_id, ingredient_id] += sign * amount
+    apply_changes(changes)
+
+
+def add_recipes(user, recipe_ids, sign=1):
+    """Учитывает рецепты, добавленные в корзину пользователя."""
+    # id из адреса запроса приходят строками.
+    change_carts(
+        ((user.id, int(recipe_id)) for recipe_id in recipe_ids), sign
+    )
+
+
+def remove_recipes(user, recipe_ids):
+    """Учитывает рецепты, убранные из корзины пользователя."""
+    add_recipes(user, recipe_ids, sign=-1)
+
+
+def change_recipe(recipe_id, old_amounts, new_amounts):
+    """Переносит изменение состава рецепта в корзины всех пользователей.
+
+    old_amounts и new_amounts — словари {ingredient_id: amount}.
+    """
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    apply_changes({
+        (user_id, ingredient_id): delta
+        for user_id in ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('user_id', flat=True)
+        for ingredient_id, delta in deltas.items()
+    })
+
+
+def expected_items(user_ids=None):
+    """Агрегат, посчитанный заново по корзинам и составам рецептов."""
+    carts = ShoppingCart.objects.all()
+    if user_ids is not None:
+        carts = carts.filter(user_id__in=user_ids)
+    return (
+        carts
+        .filter(recipe__ingredient_amounts__isnull=False)
+        .values_list('user_id', 'recipe__ingredient_amounts__ingredient_id')
+        .annotate(amount=Sum('recipe__ingredient_amounts__amount'))
+        .order_by()
+    )
+
+
+@task
+@transaction.atomic
+def rebuild(user_ids=None):
+    """Пересобирает агрегат с нуля; возвращает число записанных строк."""
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    items.delete()
+    batch, created = [], 0
+    for user_id, ingredient_id, amount in expected_items(
+        user_ids
+    ).iterator(chunk_size=BATCH_SIZE):
+        batch.append(ShoppingListItem(
+            user_id=user_id, ingredient_id=ingredient_id, amount=amount
+        ))
+        if len(batch) == BATCH_SIZE:
+            created += len(ShoppingListItem.objects.bulk_create(batch))
+            batch = []
+    created += len(ShoppingListItem.objects.bulk_create(batch))
+    return created
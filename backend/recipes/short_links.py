@@ -0,0 +1,138 @@
+"""Короткие ссылки на рецепты.
+
+Код ссылки — id рецепта в base62. Если SHORT_LINK_SIGNATURE_LENGTH больше
+нуля, к нему дописывается подпись такой длины, и коды нельзя перебрать
+подряд. Существование рецепта проверяется по множеству id в памяти
+процесса, поэтому переход по ссылке обычно не обращается к базе.
+"""
+import string
+import threading
+import time
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .models import Recipe
+
+ALPHABET = string.digits + string.ascii_letters
+BASE = len(ALPHABET)
+SIGNATURE_SALT = 'recipes.short_links'
+# Как часто можно дочитывать из базы id новее известных процессу.
+REFRESH_INTERVAL = 1
+
+
+def encode_base62(number: int, length: int = 1) -> str:
+    digits = []
+    while number or len(digits) < length:
+        number, digit = divmod(number, BASE)
+        digits.append(ALPHABET[digit])
+    return ''.join(reversed(digits))
+
+
+def decode_base62(code: str) -> int:
+    number = 0
+    for char in code:
+        digit = ALPHABET.find(char)
+        if digit < 0:
+            raise ValueError(f'Недопустимый символ {char!r} в коде.')
+        number = number * BASE + digit
+    return number
+
+
+def _signature(recipe_id: int) -> str:
+    length = settings.SHORT_LINK_SIGNATURE_LENGTH
+    digest = salted_hmac(SIGNATURE_SALT, str(recipe_id)).digest()
+    return encode_base62(
+        int.from_bytes(digest, 'big') % BASE ** length, length
+    )
+
+
+def make_code(recipe_id: int) -> str:
+    code = encode_base62(recipe_id)
+    if settings.SHORT_LINK_SIGNATURE_LENGTH:
+        code += _signature(recipe_id)
+    return code
+
+
+def parse_code(code: str) -> int | None:
+    """Id рецепта из кода или None, если код испорчен."""
+    length = settings.SHORT_LINK_SIGNATURE_LENGTH
+    if length:
+        code, signature = code[:-length], code[-length:]
+    if not code:
+        return None
+    try:
+        recipe_id = decode_base62(code)
+    except ValueError:
+        return None
+    if length and not constant_time_compare(
+        signature, _signature(recipe_id)
+    ):
+        return None
+    return recipe_id
+
+
+class RecipeIds:
+    """Множество id существующих рецептов.
+
+    Рецепты, созданные и удалённые в этом процессе, учитываются сигналами.
+    Id больше максимального известного дочитываются из базы не чаще раза
+    в REFRESH_INTERVAL секунд — так находятся рецепты, созданные другими
+    процессами, а перебор несуществующих кодов не нагружает базу.
+    Множество целиком перечитывается раз в SHORT_LINK_IDS_TTL секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = None
+        self._max_id = 0
+        self._loaded_at = 0
+        self._checked_at = 0
+
+    def _is_stale(self):
+        return (
+            self._ids is None
+            or time.monotonic() - self._loaded_at
+            > settings.SHORT_LINK_IDS_TTL
+        )
+
+    def _load(self):
+        with self._lock:
+            if not self._is_stale():
+                return
+            ids = set(Recipe.objects.values_list('pk', flat=True))
+            self._ids = ids
+            self._max_id = max(ids, default=0)
+            self._loaded_at = self._checked_at = time.monotonic()
+
+    def _load_newer(self):
+        with self._lock:
+            if time.monotonic() - self._checked_at < REFRESH_INTERVAL:
+                return
+            newer = set(Recipe.objects.filter(
+                pk__gt=self._max_id
+            ).values_list('pk', flat=True))
+            self._ids = self._ids | newer
+            self._max_id = max(newer, default=self._max_id)
+            self._checked_at = time.monotonic()
+
+    def __contains__(self, recipe_id: int) -> bool:
+        if self._is_stale():
+            self._load()
+        if recipe_id in self._ids:
+            return True
+        if recipe_id <= self._max_id:
+            return False
+        self._load_newer()
+        return recipe_id in self._ids
+
+    def add(self, recipe_id: int):
+        if self._ids is not None:
+            self._ids.add(recipe_id)
+
+    def discard(self, recipe_id: int):
+        if self._ids is not None:
+            self._ids.discard(recipe_id)
+
+
+recipe_ids = RecipeIds()
@@ -0,0 +1,127 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from . import counters, search, shopping_list, versions
+from .constants import COOKING_TIME_HISTOGRAM_CACHE_KEY
+from .coverage import coverage_index
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Subscription,
+    Tag,
+    User,
+)
+from .short_links import recipe_ids
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    shopping_list.change_recipe(
+        instance.id,
+        dict(instance.ingredient_amounts.values_list(
+            'ingredient_id', 'amount'
+        )),
+        {},
+    )
+
+
+@receiver(pre_delete, sender=Recipe)
+def decrement_author_recipes_count(sender, instance, **kwargs):
+    counters.increment(
+        User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def reset_cooking_time_histogram(sender, **kwargs):
+    cache.delete(COOKING_TIME_HISTOGRAM_CACHE_KEY)
+
+
+@receiver(post_save, sender=Recipe)
+def remember_recipe_id(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: recipe_ids.add(instance.pk))
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_recipe_id(sender, instance, **kwargs):
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: recipe_ids.discard(recipe_id))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    versions.bump(versions.TAGS)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipes_version(sender, **kwargs):
+    versions.bump(versions.RECIPES)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def bump_user_state_version(sender, instance, **kwargs):
+    versions.bump(versions.user_state(instance.user_id))
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields=None,
+                         **kwargs):
+    """Профиль автора входит в ответ с рецептом, обновляем его дату."""
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    Recipe.objects.filter(author=instance).update(updated_at=timezone.now())
+    versions.bump(versions.RECIPES)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def reindex_recipe(sender, instance, **kwargs):
+    search.schedule_update([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def reindex_recipe_ingredients(sender, instance, **kwargs):
+    search.schedule_update([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(sender, instance, created, **kwargs):
+    if not created:
+        search.schedule_update(
+            instance.recipes.values_list('id', flat=True)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_coverage_index(sender, **kwargs):
+    transaction.on_commit(coverage_index.invalidate)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_coverage_index(sender, instance, **kwargs):
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: coverage_index.forget([recipe_id]))
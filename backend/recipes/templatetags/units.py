@@ -19,6 +19,15 @@ UNITS = {
 }
 
 
+# Индекс формы (1, 2–4, 5+) для каждого остатка от деления на 100.
+PLURAL_FORM_INDEX = tuple(
+    0 if n % 10 == 1 and n != 11
+    else 1 if 2 <= n % 10 <= 4 and not 12 <= n <= 14
+    else 2
+    for n in range(100)
+)
+
+
 @register.filter
 def pluralize_unit(unit, amount):
     """Склоняет единицу измерения в зависимости от количества."""
@@ -31,10 +40,4 @@ def pluralize_unit(unit, amount):
     if not forms:
         return unit
 
-    n = int(amount)
-    if n % 10 == 1 and n % 100 != 11:
-        return forms[0]
-    elif 2 <= n % 10 <= 4 and not (12 <= n % 100 <= 14):
-        return forms[1]
-    else:
-        return forms[2]
+    return forms[PLURAL_FORM_INDEX[int(amount) % 100]]
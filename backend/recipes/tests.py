@@ -0,0 +1,181 @@
+import random
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .admin import RecipeAdmin
+from .coverage import CoverageIndex
+from .models import Ingredient, Recipe, RecipeIngredient, Tag, User
+
+RECIPES = 20
+
+
+class RecipeChangelistQueriesTest(TestCase):
+    """Число запросов списка рецептов в админке не зависит от страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag-{number}')
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}', unit='г')
+            for number in range(4)
+        ]
+        for number in range(RECIPES):
+            recipe = Recipe.objects.create(
+                author=cls.admin,
+                name=f'Рецепт {number}',
+                image='recipes/images/test.png',
+                text='Описание',
+                cooking_time=5 + number,
+            )
+            recipe.tags.set(tags[:2])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+                for ingredient in ingredients
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:recipes_recipe_changelist')
+        # Гистограмма фильтра по времени кэшируется первым запросом.
+        self.client.get(self.url)
+
+    def _get_page(self, per_page):
+        with mock.patch.object(RecipeAdmin, 'list_per_page', per_page):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            len(response.context['cl'].result_list), per_page
+        )
+
+    def test_queries_do_not_depend_on_page_size(self):
+        with CaptureQueriesContext(connection) as small_page:
+            self._get_page(5)
+        with self.assertNumQueries(len(small_page)):
+            self._get_page(RECIPES)
+
+
+class CoverageIndexTest(TestCase):
+    """Выдача CoverageIndex совпадает с ранжированием перебором."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            'author', 'author@example.com', 'password'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}', unit='г')
+            for number in range(16)
+        ]
+
+    def setUp(self):
+        self.random = random.Random(1)
+        self.index = CoverageIndex()
+        for _ in range(40):
+            self._create()
+
+    def _compose(self, recipe):
+        """Задаёт рецепту случайный состав и отмечает его изменённым.
+
+        Последние ингредиенты редкие: их позиции хранятся массивом, а не
+        битовой картой.
+        """
+        ingredients = self.random.sample(
+            self.ingredients[:10], self.random.randint(1, 5)
+        )
+        if self.random.random() < 0.2:
+            ingredients.append(self.random.choice(self.ingredients[10:]))
+        recipe.ingredient_amounts.all().delete()
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        recipe.save()
+
+    def _create(self):
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name='Рецепт',
+            image='recipes/images/test.png',
+            text='Описание',
+            cooking_time=10,
+        )
+        self._compose(recipe)
+        return recipe
+
+    def _expected(self, pantry, max_missing=None):
+        compositions = {}
+        for recipe_id, ingredient_id in RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ):
+            compositions.setdefault(recipe_id, set()).add(ingredient_id)
+        ranked = []
+        for recipe_id, ingredient_ids in compositions.items():
+            matched = len(ingredient_ids & pantry)
+            needed = len(ingredient_ids)
+            if not matched:
+                continue
+            if max_missing is not None and needed - matched > max_missing:
+                continue
+            ranked.append((recipe_id, matched, needed))
+        # Рецепты создаются по возрастанию id, поэтому новее — больший id.
+        ranked.sort(key=lambda row: (
+            -row[1] / row[2], row[2] - row[1], -row[1], -row[0]
+        ))
+        return ranked
+
+    def _assert_ranking(self):
+        for _ in range(20):
+            pantry = {
+                ingredient.pk for ingredient in self.random.sample(
+                    self.ingredients, self.random.randint(1, 8)
+                )
+            }
+            for max_missing in (None, 0, 2):
+                with self.subTest(pantry=pantry, max_missing=max_missing):
+                    expected = self._expected(pantry, max_missing)
+                    results = self.index.search(pantry, max_missing)
+                    self.assertEqual(len(results), len(expected))
+                    self.assertEqual(results[:len(results)], expected)
+                    self.assertEqual(results[3:9], expected[3:9])
+
+    def test_build(self):
+        self._assert_ranking()
+
+    def test_refresh_after_changes(self):
+        self._assert_ranking()
+        recipes = list(Recipe.objects.all())
+        for recipe in self.random.sample(recipes, 10):
+            self._compose(recipe)
+        emptied = self.random.choice(recipes)
+        emptied.ingredient_amounts.all().delete()
+        emptied.save()
+        for _ in range(5):
+            self._create()
+        self.index.invalidate()
+        self._assert_ranking()
+
+    def test_forget_deleted(self):
+        self._assert_ranking()
+        deleted = self.random.sample(
+            list(Recipe.objects.values_list('pk', flat=True)), 8
+        )
+        Recipe.objects.filter(pk__in=deleted).delete()
+        self.index.forget(deleted)
+        self._assert_ranking()
+        self._create()
+        self.index.invalidate()
+        self._assert_ranking()
@@ -1,7 +1,12 @@
-from django.urls import path
+from django.urls import path, re_path
 
-from .views import short_link_redirect
+from .views import legacy_short_link_redirect, short_link_redirect
 
 urlpatterns = [
-    path('<int:recipe_id>/', short_link_redirect, name='short_link'),
+    path(
+        '<int:recipe_id>/', legacy_short_link_redirect,
+        name='legacy_short_link'
+    ),
+    re_path(r'^(?P<code>[0-9A-Za-z]+)$', short_link_redirect,
+            name='short_link'),
 ]
@@ -0,0 +1,72 @@
+"""Версии данных в базе.
+
+Версия — момент последнего изменения набора данных в наносекундах. По
+ней API строит ETag и Last-Modified, не читая сами данные, а процессы
+узнают о переимпорте справочников. Версии лежат в таблице DataVersion,
+поэтому их изменения видят все процессы: воркеры веб-сервера, команды
+импорта и обработчик очереди. Если версии ещё нет, она создаётся с
+текущим временем: клиенты один раз получат полный ответ.
+"""
+import threading
+import time
+
+from django.db import transaction
+
+from .models import DataVersion
+
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+RECIPES = 'recipes'
+
+_pending = threading.local()
+
+
+def user_state(user_id):
+    """Избранное, корзина и подписки пользователя."""
+    return f'user:{user_id}'
+
+
+def _current(names):
+    return dict(DataVersion.objects.filter(name__in=names).values_list(
+        'name', 'changed_at'
+    ))
+
+
+def get_versions(*names):
+    """Версии одним запросом; отсутствующие создаются."""
+    versions = _current(names)
+    missing = [name for name in names if name not in versions]
+    if missing:
+        now = time.time_ns()
+        DataVersion.objects.bulk_create(
+            [DataVersion(name=name, changed_at=now) for name in missing],
+            ignore_conflicts=True,
+        )
+        versions.update(_current(missing))
+    return [versions[name] for name in names]
+
+
+def get_version(name):
+    return get_versions(name)[0]
+
+
+def _flush():
+    names = getattr(_pending, 'names', set())
+    if not names:
+        return
+    now = time.time_ns()
+    DataVersion.objects.bulk_create(
+        [DataVersion(name=name, changed_at=now) for name in names],
+        update_conflicts=True,
+        unique_fields=('name',),
+        update_fields=('changed_at',),
+    )
+    names.clear()
+
+
+def bump(*names):
+    """Меняет версии после фиксации транзакции, одним запросом."""
+    if not hasattr(_pending, 'names'):
+        _pending.names = set()
+    _pending.names.update(names)
+    transaction.on_commit(_flush)
@@ -1,11 +1,20 @@
+from django.http import Http404
 from django.shortcuts import redirect
-from django.core.exceptions import ValidationError
 
-from recipes.models import Recipe
+from recipes.short_links import parse_code, recipe_ids
 
 
-def short_link_redirect(request, recipe_id):
-    """Редирект с короткой ссылки на страницу рецепта."""
-    if not Recipe.objects.filter(id=recipe_id).exists():
-        raise ValidationError(f'Рецепт с id={recipe_id} не найден.')
+def _redirect_to_recipe(recipe_id):
+    if recipe_id is None or recipe_id not in recipe_ids:
+        raise Http404('Рецепт не найден.')
     return redirect(f'/recipes/{recipe_id}/')
+
+
+def short_link_redirect(request, code):
+    """Редирект с короткой ссылки на страницу рецепта."""
+    return _redirect_to_recipe(parse_code(code))
+
+
+def legacy_short_link_redirect(request, recipe_id):
+    """Редирект со старых ссылок вида /s/<id>/."""
+    return _redirect_to_recipe(recipe_id)